@@ -6,3 +6,6 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+python manage.py createcachetable
+# Rollups for history recorded before they existed; a no-op once built
+python manage.py rebuild_price_rollups --missing
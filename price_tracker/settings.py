@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tracker.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,7 +63,8 @@ ROOT_URLCONF = 'price_tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for tracker.middleware.MetricsMiddleware
+        'BACKEND': 'tracker.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,6 +95,37 @@ if database_url:
     DATABASES['default'] = dj_database_url.parse(database_url)
 
 
+# Caches
+# The 'search' cache holds alternative-price search results. LocMemCache is
+# per-process with LRU eviction; set SEARCH_CACHE_BACKEND to
+# django.core.cache.backends.db.DatabaseCache (LOCATION = table name, created
+# by `manage.py createcachetable`) or filebased.FileBasedCache to share it
+# between workers.
+# The 'summary' cache holds per-user dashboard/profile totals. Entries are
+# invalidated on writes, including the refresh worker's, which runs in its
+# own process, so it defaults to DatabaseCache (its table is created by
+# migration 0018) to share invalidations with the web workers. Any other
+# backend set through SUMMARY_CACHE_BACKEND must be shared too.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': os.environ.get('SEARCH_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SEARCH_CACHE_LOCATION', 'search_cache'),
+        'TIMEOUT': int(os.environ.get('SEARCH_CACHE_TTL', '3600')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    'summary': {
+        'BACKEND': os.environ.get('SUMMARY_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('SUMMARY_CACHE_LOCATION', 'summary_cache'),
+        'TIMEOUT': int(os.environ.get('SUMMARY_CACHE_TTL', '300')),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -166,3 +199,40 @@ AUTHENTICATION_BACKENDS = [
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'dashboard'
 LOGIN_URL = 'login'
+
+# Price refresh concurrency
+PRICE_REFRESH_MAX_WORKERS = int(os.environ.get('PRICE_REFRESH_MAX_WORKERS', '16'))
+PRICE_REFRESH_DEFAULT_DOMAIN_LIMIT = 2
+PRICE_REFRESH_DOMAIN_LIMITS = {
+    'amazon.in': int(os.environ.get('PRICE_REFRESH_AMAZON_LIMIT', '4')),
+    'flipkart.com': int(os.environ.get('PRICE_REFRESH_FLIPKART_LIMIT', '4')),
+    'myntra.com': int(os.environ.get('PRICE_REFRESH_MYNTRA_LIMIT', '4')),
+}
+# Refresh results are written back in batches of this many products
+PRICE_REFRESH_BATCH_SIZE = int(os.environ.get('PRICE_REFRESH_BATCH_SIZE', '100'))
+
+# Price history storage: 'changes' inserts a row only when the price moves
+# (repeats bump last_seen/observations on the latest row); 'all' stores every observation
+PRICE_HISTORY_MODE = os.environ.get('PRICE_HISTORY_MODE', 'changes')
+# Raw history older than this many days is moved to compressed archives by
+# the archive_price_history command (rollups are kept); 0 disables
+PRICE_HISTORY_RETENTION_DAYS = int(os.environ.get('PRICE_HISTORY_RETENTION_DAYS', '365'))
+
+# Scraper HTTP connection pool: max keep-alive connections per marketplace host
+SCRAPER_POOL_MAXSIZE = int(os.environ.get('SCRAPER_POOL_MAXSIZE', '8'))
+
+# BeautifulSoup tree builder for scraping; unset picks lxml when installed, else html.parser
+SCRAPER_HTML_PARSER = os.environ.get('SCRAPER_HTML_PARSER') or None
+
+# Alternative-price searches: overall deadline (seconds) and shared worker pool size
+SCRAPER_SEARCH_DEADLINE = float(os.environ.get('SCRAPER_SEARCH_DEADLINE', '8'))
+SCRAPER_SEARCH_WORKERS = int(os.environ.get('SCRAPER_SEARCH_WORKERS', '16'))
+
+# Request metrics (tracker.middleware.MetricsMiddleware): fraction of requests
+# sampled, 0 disables. Metrics are per process and served at /metrics/ to
+# staff or with "Authorization: Bearer $METRICS_TOKEN"
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Sampled requests slower than this are logged with their slowest queries; 0 disables
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', '1000'))
+METRICS_SLOW_REQUEST_TOP_QUERIES = int(os.environ.get('METRICS_SLOW_REQUEST_TOP_QUERIES', '5'))
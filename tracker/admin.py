@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, PriceHistory
+from .models import ImportJob, ImportRow, Product, PriceHistory, PriceHistoryArchive, PriceRollup, RefreshJob
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -10,6 +10,40 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(PriceHistory)
 class PriceHistoryAdmin(admin.ModelAdmin):
-    list_display = ('product', 'price', 'timestamp')
+    list_display = ('product', 'price', 'timestamp', 'last_seen', 'observations')
     list_filter = ('timestamp',)
     search_fields = ('product__name',)
+
+@admin.register(PriceHistoryArchive)
+class PriceHistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ('product', 'start', 'end', 'row_count', 'created_at')
+    search_fields = ('product__name',)
+    exclude = ('data',)
+
+@admin.register(PriceRollup)
+class PriceRollupAdmin(admin.ModelAdmin):
+    list_display = ('product', 'resolution', 'bucket', 'open', 'high', 'low', 'close', 'count')
+    list_filter = ('resolution', 'bucket')
+    search_fields = ('product__name',)
+
+@admin.register(RefreshJob)
+class RefreshJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'total', 'done', 'failed', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+class ImportRowInline(admin.TabularInline):
+    model = ImportRow
+    fields = ('line', 'url', 'target_price', 'status', 'product', 'error')
+    readonly_fields = fields
+    raw_id_fields = ('product',)
+    extra = 0
+    can_delete = False
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'source', 'total', 'created_at')
+    list_filter = ('source',)
+    search_fields = ('user__email',)
+    readonly_fields = ('created_at',)
+    inlines = [ImportRowInline]
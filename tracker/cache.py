@@ -0,0 +1,99 @@
+import hashlib
+import threading
+
+from django.core.cache import caches
+
+from .models import Product
+from .scraper import search_marketplaces
+
+# Alias in settings.CACHES holding alternative-price search results
+SEARCH_CACHE_ALIAS = 'search'
+# Alias holding per-user deal summaries (Product.objects.deal_stats())
+SUMMARY_CACHE_ALIAS = 'summary'
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for one cache (per process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+search_stats = CacheStats()
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def search_cache_key(query):
+    digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+    return f"search:{digest}"
+
+
+def cached_search_marketplaces(query):
+    """
+    search_marketplaces() behind the 'search' cache, keyed by normalized
+    query. TTL and size bound come from the cache's TIMEOUT/MAX_ENTRIES.
+    Partial responses (a marketplace missed the deadline) are not cached.
+    """
+    cache = caches[SEARCH_CACHE_ALIAS]
+    key = search_cache_key(query)
+    response = cache.get(key)
+    if response is not None:
+        search_stats.hit()
+        return response
+
+    search_stats.miss()
+    response = search_marketplaces(normalize_query(query))
+    if not response['partial']:
+        cache.set(key, response)
+    return response
+
+
+def cached_search_products(query):
+    return cached_search_marketplaces(query)['results']
+
+
+def summary_cache_key(user_id):
+    return f"summary:{user_id}"
+
+
+def get_deal_summary(user):
+    """
+    The user's product count, deal count and savings, from the 'summary'
+    cache when possible. Entries are dropped by invalidate_deal_summaries
+    whenever the user's products change (see signals.py).
+    """
+    cache = caches[SUMMARY_CACHE_ALIAS]
+    key = summary_cache_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = Product.objects.filter(user=user).deal_stats()
+        cache.set(key, stats)
+    return stats
+
+
+def invalidate_deal_summaries(user_ids):
+    keys = [summary_cache_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        caches[SUMMARY_CACHE_ALIAS].delete_many(keys)
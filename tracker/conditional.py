@@ -0,0 +1,89 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Product
+
+# HTTP validators (ETag/Last-Modified) for the read-only views, so polling
+# clients and fronting caches revalidate with a single cheap query and get
+# a 304 instead of a re-rendered page or re-serialized payload.
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_view(state_func):
+    """
+    Decorates a view with validators from state_func(request, *args,
+    **kwargs), which returns (etag, last_modified) - last_modified may be
+    None - or None when the response can't be revalidated. Matching
+    conditional GETs get a 304 without running the view; validated
+    responses are marked private and must be revalidated on every use.
+    """
+    def decorator(view):
+        def state(request, *args, **kwargs):
+            # condition() asks for the ETag and Last-Modified separately
+            if not hasattr(request, '_validators'):
+                request._validators = state_func(request, *args, **kwargs)
+            return request._validators
+
+        def etag(request, *args, **kwargs):
+            validators = state(request, *args, **kwargs)
+            return validators[0] if validators else None
+
+        def last_modified(request, *args, **kwargs):
+            validators = state(request, *args, **kwargs)
+            return validators[1] if validators else None
+
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if getattr(request, '_validators', None):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def history_state(request, product_id):
+    """
+    Validators for a product's price history. Every recorded observation
+    also moves last_checked, so it stands in for the latest history row
+    without touching the history table.
+    """
+    state = Product.objects.filter(pk=product_id).values_list('last_checked', 'currency').first()
+    if state is None:
+        return None
+    last_checked, currency = state
+    return make_etag(product_id, last_checked, currency, request.GET.urlencode()), last_checked
+
+
+def product_list_state(request, *args, **kwargs):
+    """
+    Validators for pages listing the user's products: one aggregate over
+    their products, plus what else the page shows (user name, CSRF cookie,
+    query string). ETag only - deleting a product moves no timestamp, so
+    Last-Modified alone would miss it. Skipped while flash messages are
+    pending, since the page would consume them.
+    """
+    if not request.user.is_authenticated or len(get_messages(request)):
+        return None
+    stats = Product.objects.filter(user=request.user).aggregate(
+        count=Count('id'),
+        newest=Max('id'),
+        checked=Max('last_checked'),
+        fetching=Count('id', filter=Q(fetch_status__in=[Product.FETCH_PENDING, Product.FETCH_RUNNING])),
+    )
+    user = request.user
+    return make_etag(
+        request.path, request.GET.urlencode(), user.pk, user.get_full_name(), user.username,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME), sorted(stats.items()),
+    ), None
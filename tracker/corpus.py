@@ -0,0 +1,62 @@
+import json
+import urllib.parse
+from pathlib import Path
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+# Saved marketplace pages for offline tests and benchmarks. manifest.json
+# lists each page with the URL it is served for and what the scraper is
+# expected to extract from it.
+PAGES_DIR = Path(__file__).resolve().parent / 'testdata' / 'pages'
+
+
+def load_manifest():
+    with open(PAGES_DIR / 'manifest.json', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_page(entry):
+    return (PAGES_DIR / entry['file']).read_bytes()
+
+
+def page_key(url):
+    """Pages are matched on host and path; search query strings are ignored."""
+    parts = urllib.parse.urlsplit(url)
+    return parts.hostname, parts.path
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    A requests transport that serves corpus pages for their manifest URLs
+    (and 404s everything else), so the real fetch/parse code runs without
+    touching the network. Mount it with scraper.sessions.using_adapter().
+    """
+
+    def __init__(self, manifest=None):
+        super().__init__()
+        manifest = manifest or load_manifest()
+        self.pages = {}
+        for entries in manifest.values():
+            for entry in entries:
+                self.pages[page_key(entry['url'])] = read_page(entry)
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        content = self.pages.get(page_key(request.url))
+
+        response = Response()
+        response.status_code = 200 if content is not None else 404
+        response.reason = 'OK' if content is not None else 'Not Found'
+        response._content = content if content is not None else b''
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
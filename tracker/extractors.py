@@ -0,0 +1,149 @@
+import threading
+
+
+class Strategy:
+    """
+    One way of extracting a field from a page, with usage counters.
+    Strategies sharing a group read equivalent sources (e.g. alternative
+    ids for the same element) and may be reordered among themselves.
+    """
+
+    def __init__(self, name, func, group=None):
+        self.name = name
+        self.func = func
+        self.group = group
+        self.attempts = 0
+        self.hits = 0
+
+    @property
+    def success_rate(self):
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def __repr__(self):
+        return f"<Strategy {self.name} {self.hits}/{self.attempts}>"
+
+
+class StrategyList:
+    """
+    Ordered strategies for one field. The first strategy to return a value
+    wins, and the list records which one that was. Once min_samples pages
+    have been seen, each run of adjacent strategies in the same group is
+    re-sorted by how often each one won every reorder_every pages, so the
+    common selector is tried first. (Not by success rate: later strategies
+    are only tried on pages the earlier ones missed, which inflates theirs.)
+    The declared order is a precedence between different sources (a site
+    selector outranks <title>) and is never changed across groups; ties
+    keep their declared order. Ungrouped strategies, such as the price
+    class selectors, always run in declared order; in build_extractors only
+    the title-id, image-id and meta-price groups are reordered.
+    """
+
+    def __init__(self, strategies, min_samples=20, reorder_every=20):
+        self.strategies = list(strategies)
+        self.min_samples = min_samples
+        self.reorder_every = reorder_every
+        self.runs = 0
+        self._order = tuple(self.strategies)
+        self._lock = threading.Lock()
+
+    def run(self, page):
+        """Returns (value, strategy) for the first strategy that produces a value."""
+        tried = []
+        value = winner = None
+        for strategy in self._order:
+            tried.append(strategy)
+            value = strategy.func(page)
+            if value:
+                winner = strategy
+                break
+        else:
+            value = None
+        self._record(tried, winner)
+        return value, winner
+
+    def _record(self, tried, winner):
+        with self._lock:
+            self.runs += 1
+            for strategy in tried:
+                strategy.attempts += 1
+            if winner:
+                winner.hits += 1
+            if self.runs >= self.min_samples and self.runs % self.reorder_every == 0:
+                self._order = tuple(self._reordered())
+
+    def _reordered(self):
+        order = []
+        run = []
+        for strategy in self.strategies:
+            if run and (strategy.group is None or strategy.group != run[0].group):
+                order.extend(sorted(run, key=lambda s: -s.hits))
+                run = []
+            run.append(strategy)
+        order.extend(sorted(run, key=lambda s: -s.hits))
+        return order
+
+    @property
+    def order(self):
+        return [strategy.name for strategy in self._order]
+
+    def stats(self):
+        with self._lock:
+            return [
+                {'strategy': s.name, 'attempts': s.attempts, 'hits': s.hits}
+                for s in self._order
+            ]
+
+
+class SiteExtractor:
+    """Title, price and image strategies for one site."""
+
+    FIELDS = ('title', 'price', 'image')
+
+    def __init__(self, name, title=(), price=(), image=(), **options):
+        self.name = name
+        self.fields = {
+            'title': StrategyList(title, **options),
+            'price': StrategyList(price, **options),
+            'image': StrategyList(image, **options),
+        }
+
+    def extract(self, page):
+        """Returns {field: value} for every field, None where nothing matched."""
+        return {field: self.fields[field].run(page)[0] for field in self.FIELDS}
+
+    def stats(self):
+        return {field: strategies.stats() for field, strategies in self.fields.items()}
+
+
+class ExtractorRegistry:
+    """
+    Site extractors keyed by host. key_func maps a URL to a registry key
+    (e.g. its marketplace). URLs whose key is not registered are offered to
+    each extractor's match predicate before falling back to the default.
+    """
+
+    def __init__(self, key_func, default):
+        self.key_func = key_func
+        self.default = default
+        self._extractors = {}
+        self._predicates = []
+
+    def register(self, key, extractor, matches=None):
+        self._extractors[key] = extractor
+        if matches:
+            self._predicates.append((matches, extractor))
+
+    def get(self, *urls):
+        for url in urls:
+            if url:
+                extractor = self._extractors.get(self.key_func(url))
+                if extractor:
+                    return extractor
+        for matches, extractor in self._predicates:
+            if any(url and matches(url) for url in urls):
+                return extractor
+        return self.default
+
+    def stats(self):
+        extractors = list(self._extractors.values()) + [self.default]
+        return {extractor.name: extractor.stats() for extractor in extractors}
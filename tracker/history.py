@@ -0,0 +1,405 @@
+import json
+import zlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import PriceHistory, PriceHistoryArchive, PriceRollup, Product
+
+# PRICE_HISTORY_MODE values. In 'changes' mode a PriceHistory row is only
+# inserted when the price moves; repeat observations of the same price bump
+# the latest row's last_seen and observations instead. 'all' keeps one row
+# per observation.
+MODE_CHANGES = 'changes'
+MODE_ALL = 'all'
+
+CENT = Decimal('0.01')
+
+# Product columns maintained from price observations; avg_price_30d covers
+# the last AVERAGE_DAYS daily rollups
+PRODUCT_STATS_FIELDS = [
+    'lowest_price', 'highest_price', 'avg_price_30d', 'price_changed_at', 'price_change_count',
+]
+AVERAGE_DAYS = 30
+
+# Resolutions served by the history endpoint, and the longest range 'auto'
+# answers from raw rows and from hourly rollups; longer ranges use daily
+RESOLUTION_RAW = 'raw'
+RESOLUTIONS = (RESOLUTION_RAW, PriceRollup.RESOLUTION_HOUR, PriceRollup.RESOLUTION_DAY)
+RAW_MAX_SPAN = timedelta(days=2)
+HOURLY_MAX_SPAN = timedelta(days=14)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+DEFAULT_RETENTION_DAYS = 365
+
+
+def get_history_mode():
+    return getattr(settings, 'PRICE_HISTORY_MODE', MODE_CHANGES)
+
+
+def as_price(value):
+    """Rounds a scraped price the way PriceHistory.price stores it."""
+    return Decimal(str(value)).quantize(CENT)
+
+
+def latest_entries(product_ids):
+    """The most recent PriceHistory row for each product, keyed by product id."""
+    latest = PriceHistory.objects.filter(product=OuterRef('product')).order_by('-timestamp', '-pk').values('pk')[:1]
+    rows = PriceHistory.objects.filter(product_id__in=product_ids, pk=Subquery(latest))
+    return {row.product_id: row for row in rows}
+
+
+def record_prices(observations, mode=None, save_stats=True):
+    """
+    Stores price observations, a list of (product, price, seen_at) tuples,
+    according to PRICE_HISTORY_MODE, folds them into the hourly and daily
+    rollups and updates each product's PRODUCT_STATS_FIELDS. Inserts are
+    done with one bulk_create and last-seen bumps with one bulk_update; call
+    inside a transaction. With save_stats=False the product stats are only
+    set in memory, for callers that save the products themselves. Returns
+    the newly created history rows.
+    """
+    mode = mode or get_history_mode()
+    if not observations:
+        return []
+
+    products = {product.pk: product for product, price, seen_at in observations}
+    latest = latest_entries(products)
+
+    created = []
+    bumped = {}
+    for product, price, seen_at in observations:
+        price = as_price(price)
+        row = latest.get(product.pk)
+        observe_stats(product, price, seen_at, row.price if row is not None else None)
+        if mode == MODE_CHANGES and row is not None and row.price == price:
+            row.last_seen = seen_at
+            row.observations += 1
+            if row.pk is not None:
+                bumped[row.pk] = row
+            continue
+        row = PriceHistory(product=product, price=price, timestamp=seen_at, last_seen=seen_at)
+        created.append(row)
+        latest[product.pk] = row
+
+    if bumped:
+        PriceHistory.objects.bulk_update(bumped.values(), ['last_seen', 'observations'])
+    if created:
+        PriceHistory.objects.bulk_create(created)
+    update_rollups(observations)
+    update_averages(products.values())
+    if save_stats:
+        Product.objects.bulk_update(products.values(), PRODUCT_STATS_FIELDS)
+    return created
+
+
+def observe_stats(product, price, seen_at, previous):
+    """Folds one observation into the product's low/high and change tracking."""
+    product.lowest_price = price if product.lowest_price is None else min(product.lowest_price, price)
+    product.highest_price = price if product.highest_price is None else max(product.highest_price, price)
+    if previous != price:
+        if previous is not None:
+            product.price_change_count += 1
+        product.price_changed_at = seen_at
+
+
+def update_averages(products):
+    """Sets avg_price_30d on each product from its daily rollups, in one query."""
+    since = bucket_start(timezone.now() - timedelta(days=AVERAGE_DAYS), PriceRollup.RESOLUTION_DAY)
+    totals = {
+        row['product_id']: row
+        for row in PriceRollup.objects.filter(
+            product_id__in=[product.pk for product in products],
+            resolution=PriceRollup.RESOLUTION_DAY,
+            bucket__gte=since,
+        ).values('product_id').annotate(price_sum=Sum('price_sum'), count=Sum('count'))
+    }
+    for product in products:
+        row = totals.get(product.pk)
+        product.avg_price_30d = (row['price_sum'] / row['count']).quantize(CENT) if row and row['count'] else None
+
+
+def record_price(product, price, seen_at=None):
+    """Stores a single observation; see record_prices."""
+    return record_prices([(product, price, seen_at or timezone.now())])
+
+
+def step_series(rows):
+    """
+    Expands history rows (oldest first) into (timestamp, price) points for
+    a step chart: each row contributes its first sighting and, if the price
+    was seen again later, its last sighting, so a price held between
+    refreshes appears as a flat run up to the next change.
+    """
+    points = []
+    for row in rows:
+        points.append((row.timestamp, row.price))
+        if row.last_seen and row.last_seen > row.timestamp:
+            points.append((row.last_seen, row.price))
+    return points
+
+
+def bucket_start(when, resolution):
+    """Start of the hour or day containing when, in the site's TIME_ZONE."""
+    local = timezone.localtime(when)
+    if resolution == PriceRollup.RESOLUTION_DAY:
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def update_rollups(observations):
+    """
+    Folds (product, price, seen_at) observations, oldest first, into the
+    hourly and daily PriceRollup rows: one read, one bulk_update and one
+    bulk_create per resolution. An observation may carry a fourth element,
+    the number of times the price was seen within seen_at's hour.
+    """
+    observations = [
+        (observation[0], as_price(observation[1]), observation[2], observation[3] if len(observation) > 3 else 1)
+        for observation in observations
+    ]
+    for resolution in (PriceRollup.RESOLUTION_HOUR, PriceRollup.RESOLUTION_DAY):
+        keyed = [
+            ((product.pk, bucket_start(seen_at, resolution)), product, price, count)
+            for product, price, seen_at, count in observations
+        ]
+        existing = {
+            (rollup.product_id, rollup.bucket): rollup
+            for rollup in PriceRollup.objects.filter(
+                product_id__in={key[0] for key, product, price, count in keyed},
+                resolution=resolution,
+                bucket__in={key[1] for key, product, price, count in keyed},
+            )
+        }
+
+        created = {}
+        changed = {}
+        for key, product, price, count in keyed:
+            rollup = existing.get(key) or created.get(key)
+            if rollup is None:
+                created[key] = PriceRollup(
+                    product=product, resolution=resolution, bucket=key[1],
+                    open=price, high=price, low=price, close=price, count=count, price_sum=price * count,
+                )
+                continue
+            rollup.high = max(rollup.high, price)
+            rollup.low = min(rollup.low, price)
+            rollup.close = price
+            rollup.count += count
+            rollup.price_sum += price * count
+            if rollup.pk is not None:
+                changed[key] = rollup
+
+        if changed:
+            PriceRollup.objects.bulk_update(changed.values(), ['high', 'low', 'close', 'count', 'price_sum'])
+        if created:
+            PriceRollup.objects.bulk_create(created.values())
+
+
+def history_observations(rows):
+    """
+    Approximate (product, price, seen_at, count) observations for stored
+    history rows, oldest first, used to rebuild rollups. A row's first
+    sighting is placed at its timestamp; its repeats are spread evenly over
+    (timestamp, last_seen], the last one at last_seen, and counted per hour
+    so every hour and day the price was held through gets its share.
+    """
+    hour = timedelta(hours=1)
+    for row in rows:
+        yield row.product, row.price, row.timestamp, 1
+        repeats = row.observations - 1
+        if repeats <= 0:
+            continue
+        span = (row.last_seen - row.timestamp) // timedelta(microseconds=1)
+        if span <= 0:
+            yield row.product, row.price, row.last_seen, repeats
+            continue
+
+        def seen_at(k):
+            # Time of the k-th of the repeats evenly spaced over the span
+            return row.timestamp + timedelta(microseconds=k * span // repeats)
+
+        k = 1
+        while k <= repeats:
+            bucket_end = bucket_start(seen_at(k) + hour, PriceRollup.RESOLUTION_HOUR)
+            offset = (bucket_end - row.timestamp) // timedelta(microseconds=1)
+            # Last k with k * span / repeats < offset
+            last = min(repeats, -(-offset * repeats // span) - 1)
+            yield row.product, row.price, seen_at(last), last - k + 1
+            k = last + 1
+
+
+def parse_bound(value, end=False):
+    """
+    Parses a from/to query value: an ISO datetime, or a date meaning the
+    start of that day (or, for end=True, the start of the next). Returns an
+    aware datetime, None if value is empty; raises ValueError if invalid.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        if end:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def auto_resolution(product, start=None, end=None):
+    """
+    Picks raw, hourly or daily data for a range so charts stay a few hundred
+    points. Ranges reaching past the retention cutoff always use rollups,
+    since their raw rows may have been archived.
+    """
+    if start is None:
+        # Rollups outlive archived raw rows, and raw rows may predate the
+        # rollups, so the series starts at the earlier of the two
+        firsts = [
+            first for first in (
+                product.price_rollups.filter(
+                    resolution=PriceRollup.RESOLUTION_DAY,
+                ).order_by('bucket').values_list('bucket', flat=True).first(),
+                product.price_history.order_by('timestamp').values_list('timestamp', flat=True).first(),
+            )
+            if first is not None
+        ]
+        if not firsts:
+            return RESOLUTION_RAW
+        start = min(firsts)
+    span = (end or timezone.now()) - start
+    cutoff = retention_cutoff()
+    if span <= RAW_MAX_SPAN and (cutoff is None or start >= cutoff):
+        return RESOLUTION_RAW
+    if span <= HOURLY_MAX_SPAN:
+        return PriceRollup.RESOLUTION_HOUR
+    return PriceRollup.RESOLUTION_DAY
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque keyset cursor for the row (timestamp, pk): '<epoch microseconds>-<pk>'."""
+    return f"{(timestamp - EPOCH) // timedelta(microseconds=1)}-{pk}"
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError if malformed."""
+    micros, _, pk = cursor.partition('-')
+    return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
+
+def raw_history_rows(product, start=None, end=None, after=None):
+    """
+    (timestamp, price, last_seen, pk) tuples for a product's history rows
+    overlapping [start, end), oldest first, optionally after a decoded
+    cursor. Reads with values_list, so no model instances are built.
+    """
+    rows = PriceHistory.objects.filter(product=product)
+    if start:
+        rows = rows.filter(last_seen__gte=start)
+    if end:
+        rows = rows.filter(timestamp__lt=end)
+    if after:
+        timestamp, pk = after
+        rows = rows.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+    return rows.order_by('timestamp', 'pk').values_list('timestamp', 'price', 'last_seen', 'pk')
+
+
+def encode_columns(rows, delta=False):
+    """
+    Columnar form of raw_history_rows() tuples: epoch-second 'timestamps',
+    'prices', and 'held' (seconds until the price was last seen). With
+    delta=True every timestamp after the first is the difference from the
+    one before it.
+    """
+    timestamps, prices, held = [], [], []
+    previous = None
+    for timestamp, price, last_seen, pk in rows:
+        epoch = int(timestamp.timestamp())
+        timestamps.append(epoch - previous if delta and previous is not None else epoch)
+        previous = epoch
+        prices.append(float(price))
+        held.append(max(0, int((last_seen - timestamp).total_seconds())))
+    return {'timestamps': timestamps, 'prices': prices, 'held': held}
+
+
+def retention_cutoff(days=None):
+    """Raw history last seen before this is archived; None if retention is disabled."""
+    if days is None:
+        days = getattr(settings, 'PRICE_HISTORY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    if not days or days <= 0:
+        return None
+    return timezone.now() - timedelta(days=days)
+
+
+def pack_history(rows):
+    """
+    Compresses (timestamp, price, last_seen, observations) tuples, oldest
+    first, into a blob: zlib over JSON columns as in encode_columns with
+    delta-encoded timestamps, plus an observations column.
+    """
+    rows = list(rows)
+    columns = encode_columns([(timestamp, price, last_seen, None) for timestamp, price, last_seen, n in rows], delta=True)
+    columns['observations'] = [n for timestamp, price, last_seen, n in rows]
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def unpack_history(data):
+    """Inverse of pack_history, to second precision."""
+    columns = json.loads(zlib.decompress(bytes(data)))
+    epoch = 0
+    for delta, price, held, observations in zip(
+        columns['timestamps'], columns['prices'], columns['held'], columns['observations'],
+    ):
+        epoch += delta
+        timestamp = EPOCH + timedelta(seconds=epoch)
+        yield timestamp, as_price(price), timestamp + timedelta(seconds=held), observations
+
+
+def archived_history(product_ids):
+    """Unsaved PriceHistory rows rebuilt from the archives of the given products, oldest first."""
+    for archive in PriceHistoryArchive.objects.filter(product_id__in=product_ids).select_related('product').order_by('product', 'start'):
+        for timestamp, price, last_seen, observations in unpack_history(archive.data):
+            yield PriceHistory(
+                product=archive.product, price=price, timestamp=timestamp,
+                last_seen=last_seen, observations=observations,
+            )
+
+
+def archive_history_batch(cutoff, batch_size):
+    """
+    Moves up to batch_size history rows last seen before cutoff into
+    PriceHistoryArchive, one blob per product, in a single transaction.
+    Each batch is committed on its own, so an interrupted run resumes where
+    it stopped. Returns the number of rows archived.
+    """
+    with transaction.atomic():
+        rows = list(
+            PriceHistory.objects.filter(last_seen__lt=cutoff)
+            .order_by('product', 'timestamp', 'pk')
+            .values_list('pk', 'product_id', 'timestamp', 'price', 'last_seen', 'observations')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        by_product = {}
+        for pk, product_id, timestamp, price, last_seen, observations in rows:
+            by_product.setdefault(product_id, []).append((timestamp, price, last_seen, observations))
+        PriceHistoryArchive.objects.bulk_create([
+            PriceHistoryArchive(
+                product_id=product_id, start=entries[0][0], end=entries[-1][2],
+                row_count=len(entries), data=pack_history(entries),
+            )
+            for product_id, entries in by_product.items()
+        ])
+        PriceHistory.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
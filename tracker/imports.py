@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import urllib.parse
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import Count
+
+from .cache import invalidate_deal_summaries
+from .models import ImportJob, ImportRow, Product
+
+# Largest accepted import, in rows
+MAX_IMPORT_ROWS = 5000
+
+# Progress reported for created rows, by their product's fetch_status
+ROW_PROGRESS = {
+    Product.FETCH_PENDING: 'pending',
+    Product.FETCH_RUNNING: 'pending',
+    Product.FETCH_OK: 'ok',
+    Product.FETCH_FAILED: 'failed',
+}
+
+validate_url = URLValidator(schemes=['http', 'https'])
+
+
+class ImportFormatError(ValueError):
+    """The import payload could not be read."""
+
+
+def parse_import(content, content_type=''):
+    """
+    Reads (url, target_price) items from a JSON or CSV payload. JSON is a
+    list of {"url", "target_price"} objects or [url, target_price] pairs,
+    optionally wrapped as {"items": [...]}. CSV has url and target_price
+    columns, with or without a header row. Returns a list of (url, price)
+    string pairs; raises ImportFormatError if the payload can't be parsed.
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFormatError("Import must be UTF-8 encoded.")
+
+    if 'json' in content_type or content.lstrip().startswith(('[', '{')):
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON: {e}")
+        if isinstance(data, dict):
+            data = data.get('items')
+        if not isinstance(data, list):
+            raise ImportFormatError("Expected a JSON list of items.")
+        items = []
+        for item in data:
+            if isinstance(item, dict):
+                items.append((item.get('url'), item.get('target_price')))
+            elif isinstance(item, (list, tuple)) and len(item) == 2:
+                items.append(tuple(item))
+            else:
+                items.append((None, None))
+    else:
+        rows = [row for row in csv.reader(io.StringIO(content)) if any(cell.strip() for cell in row)]
+        if rows and [cell.strip().lower() for cell in rows[0][:2]] == ['url', 'target_price']:
+            rows = rows[1:]
+        items = [(row[0], row[1] if len(row) > 1 else None) for row in rows]
+
+    if len(items) > MAX_IMPORT_ROWS:
+        raise ImportFormatError(f"Imports are limited to {MAX_IMPORT_ROWS} rows.")
+    return items
+
+
+def normalize_url(url):
+    """Strips whitespace and the #fragment, which never changes the product page."""
+    return urllib.parse.urldefrag(str(url).strip())[0]
+
+
+def clean_item(url, target_price):
+    """Returns (url, price, error) for one raw item."""
+    if not url:
+        return None, None, "Missing URL"
+    url = normalize_url(url)
+    try:
+        validate_url(url)
+    except ValidationError:
+        return url, None, "Invalid URL"
+    if len(url) > Product._meta.get_field('url').max_length:
+        return url, None, "URL too long"
+    try:
+        price = Decimal(str(target_price).strip())
+    except (InvalidOperation, TypeError):
+        return url, None, "Invalid target price"
+    if not price.is_finite() or price <= 0 or price >= Decimal('1e8'):
+        return url, None, "Invalid target price"
+    return url, price.quantize(Decimal('0.01')), ''
+
+
+def create_import(user, items, source=ImportJob.SOURCE_API):
+    """
+    Records an import of (url, target_price) items for user: invalid rows
+    and URLs that are repeated or already tracked are recorded without a new
+    product, and every other row gets a pending Product. Products and rows
+    are each written with one bulk_create; the refresh_prices worker then
+    scrapes the new products concurrently under its per-marketplace limits.
+    """
+    existing = dict(Product.objects.filter(
+        user=user, url__in={normalize_url(url) for url, price in items if url},
+    ).values_list('url', 'pk'))
+
+    rows = []
+    new_products = {}
+    for line, (raw_url, raw_price) in enumerate(items, start=1):
+        url, price, error = clean_item(raw_url, raw_price)
+        row = ImportRow(line=line, url=url or '', target_price=price)
+        if error:
+            row.status, row.error = ImportRow.STATUS_INVALID, error
+        elif url in existing:
+            row.status, row.error = ImportRow.STATUS_DUPLICATE, "Already tracked"
+            row.product_id = existing[url]
+        elif url in new_products:
+            row.status, row.error = ImportRow.STATUS_DUPLICATE, "Repeated in this import"
+        else:
+            row.status = ImportRow.STATUS_CREATED
+            new_products[url] = Product(
+                user=user, name=url, url=url, target_price=price, fetch_status=Product.FETCH_PENDING,
+            )
+        rows.append(row)
+
+    with transaction.atomic():
+        job = ImportJob.objects.create(user=user, source=source, total=len(rows))
+        Product.objects.bulk_create(new_products.values())
+        for row in rows:
+            row.job = job
+            if row.status == ImportRow.STATUS_CREATED:
+                row.product = new_products[row.url]
+            elif row.status == ImportRow.STATUS_DUPLICATE and row.product_id is None:
+                # Repeated within this import: point at the product it created
+                row.product = new_products[row.url]
+        ImportRow.objects.bulk_create(rows)
+    # bulk_create sends no post_save signals
+    invalidate_deal_summaries([user.pk])
+    return job
+
+
+def row_status(status, fetch_status):
+    if status != ImportRow.STATUS_CREATED:
+        return status
+    # The product was deleted since the import
+    return ROW_PROGRESS.get(fetch_status, 'failed') if fetch_status else 'failed'
+
+
+def import_status(job, include_rows=True):
+    """Progress of an import as a JSON-ready dict, with per-row status if include_rows."""
+    counts = {}
+    for row in job.rows.values('status', 'product__fetch_status').annotate(n=Count('id')).order_by():
+        key = row_status(row['status'], row['product__fetch_status'])
+        counts[key] = counts.get(key, 0) + row['n']
+
+    data = {
+        'id': job.id,
+        'status': 'running' if counts.get('pending') else 'done',
+        'total': job.total,
+        'counts': counts,
+        'created_at': job.created_at.isoformat(),
+    }
+    if include_rows:
+        data['rows'] = [
+            {
+                'line': line,
+                'url': url,
+                'status': row_status(status, fetch_status),
+                'error': fetch_error if status == ImportRow.STATUS_CREATED and fetch_error else error,
+                'product_id': product_id,
+            }
+            for line, url, status, error, product_id, fetch_status, fetch_error in job.rows.values_list(
+                'line', 'url', 'status', 'error', 'product_id', 'product__fetch_status', 'product__fetch_error',
+            )
+        ]
+    return data
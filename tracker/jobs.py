@@ -0,0 +1,232 @@
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import cached_search_products
+from .history import record_price
+from .models import Product, RefreshJob
+from .refresh import fetch_concurrently, refresh_products, RefreshWriter, UPDATED, UNCHANGED, FAILED
+
+# Minimum seconds between progress writes to the job row
+PROGRESS_INTERVAL = 1.0
+# Products taken per pass of the pending-fetch sweep
+PENDING_BATCH_SIZE = 50
+# Active products refreshed per pass of a refresh job; the worker fetches
+# pending products between passes
+JOB_CHUNK_SIZE = 200
+# A fetching product whose claim is older than this is taken to belong to a
+# worker that stopped, and is requeued; a batch of PENDING_BATCH_SIZE
+# fetches must finish well within it
+FETCH_LEASE = timedelta(minutes=15)
+# A product whose fetch failed is not requeued by a page view until this
+# long after its last attempt
+FETCH_RETRY_AFTER = timedelta(minutes=10)
+
+
+def enqueue_refresh(user=None):
+    """
+    Queues a refresh of all active products. If a refresh is already queued
+    or running, that job is returned instead of stacking a new one.
+    """
+    pending = RefreshJob.objects.filter(
+        status__in=[RefreshJob.STATUS_QUEUED, RefreshJob.STATUS_RUNNING]
+    ).order_by('created_at').first()
+    if pending:
+        return pending
+    return RefreshJob.objects.create(requested_by=user if user and user.is_authenticated else None)
+
+
+def claim_next_job():
+    """Atomically moves the oldest queued job to running and returns it."""
+    for job in RefreshJob.objects.filter(status=RefreshJob.STATUS_QUEUED).order_by('created_at')[:5]:
+        claimed = RefreshJob.objects.filter(pk=job.pk, status=RefreshJob.STATUS_QUEUED).update(
+            status=RefreshJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job, between_chunks=None):
+    """
+    Refreshes every active product, recording progress on the job row.
+    Products are refreshed JOB_CHUNK_SIZE at a time; between_chunks, if
+    given, is called after each chunk.
+    """
+    # Stalest first (never-checked products sort first), walking the
+    # (is_active, last_checked) index
+    products = list(Product.objects.filter(is_active=True).order_by('last_checked').select_related('user'))
+    job.total = len(products)
+    job.save(update_fields=['total'])
+
+    result = {UPDATED: 0, UNCHANGED: 0, FAILED: 0, 'errors': []}
+    last_write = [0.0]
+
+    def progress(done, failed):
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_INTERVAL:
+            RefreshJob.objects.filter(pk=job.pk).update(
+                done=result[UPDATED] + result[UNCHANGED] + done,
+                failed=result[FAILED] + failed,
+            )
+            last_write[0] = now
+
+    try:
+        for start in range(0, len(products), JOB_CHUNK_SIZE):
+            chunk = refresh_products(products[start:start + JOB_CHUNK_SIZE], progress=progress)
+            for outcome in (UPDATED, UNCHANGED, FAILED):
+                result[outcome] += chunk[outcome]
+            result['errors'].extend(chunk['errors'])
+            if between_chunks:
+                between_chunks()
+    except Exception as e:
+        job.refresh_from_db(fields=['done', 'failed'])
+        job.status = RefreshJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.done = result[UPDATED] + result[UNCHANGED]
+        job.failed = result[FAILED]
+        job.status = RefreshJob.STATUS_DONE
+        job.error = "\n".join(f"{product.name}: {error}" for product, error in result['errors'][:50])
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'done', 'failed', 'error', 'finished_at'])
+    return job
+
+
+def claim_pending_products(limit=PENDING_BATCH_SIZE, products=None):
+    """
+    Moves up to limit pending products (from the products queryset, if
+    given) to fetching and returns them. Rows are locked with SKIP LOCKED
+    where supported so concurrent workers take different products;
+    elsewhere the claim time doubles as a token, so a product taken by
+    another process in between is not returned.
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        pending = Product.objects.filter(fetch_status=Product.FETCH_PENDING).order_by('created_at')
+        if products is not None:
+            pending = pending.filter(pk__in=products.values('pk'))
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list('pk', flat=True)[:limit])
+        Product.objects.filter(pk__in=ids, fetch_status=Product.FETCH_PENDING).update(
+            fetch_status=Product.FETCH_RUNNING,
+            fetch_claimed_at=claimed_at,
+        )
+    return list(Product.objects.filter(
+        pk__in=ids, fetch_status=Product.FETCH_RUNNING, fetch_claimed_at=claimed_at,
+    ).select_related('user'))
+
+
+def search_fallback_price(product):
+    """Price of the best marketplace search match for the product's name, if it has one yet."""
+    if not product.name or product.name == product.url:
+        return None
+    results = cached_search_products(" ".join(product.name.split()[:5]))
+    return results[0]['price'] if results else None
+
+
+def fetch_pending_products(limit=PENDING_BATCH_SIZE, products=None):
+    """
+    Scrapes products queued by the web views (fetch_status 'pending'),
+    falling back to a marketplace search when the product page yields no
+    price. products optionally narrows the queue to a queryset. Returns the
+    number of products processed.
+    """
+    products = claim_pending_products(limit, products)
+    if not products:
+        return 0
+
+    failures = []
+    with RefreshWriter() as writer:
+        for product, details in fetch_concurrently(products):
+            if writer.add(product, details) == FAILED:
+                failures.append((product, details['error']))
+
+    for product, error in failures:
+        price = search_fallback_price(product)
+        if price:
+            product.current_price = price
+            product.last_checked = timezone.now()
+            product.fetch_status = Product.FETCH_OK
+            product.fetch_error = ''
+            product.save(update_fields=['current_price', 'last_checked', 'fetch_status', 'fetch_error'])
+            record_price(product, price)
+        else:
+            Product.objects.filter(pk=product.pk).update(
+                fetch_status=Product.FETCH_FAILED,
+                fetch_error=error or "No price found",
+            )
+    return len(products)
+
+
+def requeue_fetch(product):
+    """
+    Queues another fetch for a product that has no price yet. Returns False
+    while one is already queued or running, or while its last attempt was
+    under FETCH_RETRY_AFTER ago.
+    """
+    if product.current_price is not None or product.is_fetching:
+        return False
+    if product.fetch_claimed_at and product.fetch_claimed_at > timezone.now() - FETCH_RETRY_AFTER:
+        return False
+    Product.objects.filter(pk=product.pk).update(fetch_status=Product.FETCH_PENDING, fetch_error='')
+    product.fetch_status = Product.FETCH_PENDING
+    product.fetch_error = ''
+    return True
+
+
+def reset_interrupted_fetches(products=None):
+    """
+    Requeues products (from the products queryset, if given) left mid-fetch
+    by a worker that stopped: those whose claim is older than FETCH_LEASE.
+    Products claimed by a live worker are left alone.
+    """
+    if products is None:
+        products = Product.objects.all()
+    return products.filter(
+        Q(fetch_claimed_at__lt=timezone.now() - FETCH_LEASE) | Q(fetch_claimed_at__isnull=True),
+        fetch_status=Product.FETCH_RUNNING,
+    ).update(fetch_status=Product.FETCH_PENDING)
+
+
+def drain_pending_fetches(stdout=None):
+    """Fetches pending products until none are left. Returns the number fetched."""
+    total = 0
+    while True:
+        fetched = fetch_pending_products()
+        if not fetched:
+            return total
+        total += fetched
+        if stdout:
+            stdout.write(f"Fetched {fetched} pending products")
+
+
+def run_worker(poll_interval=5, once=False, stdout=None):
+    """
+    Consumes pending product fetches and queued refresh jobs, pending
+    fetches first since a user is waiting on them: they are also drained
+    between the chunks of a running job. With once=True, exits when both
+    queues are empty.
+    """
+    reset_interrupted_fetches()
+    while True:
+        close_old_connections()
+        drain_pending_fetches(stdout)
+        job = claim_next_job()
+        if job:
+            if stdout:
+                stdout.write(f"Running {job}")
+            job = run_job(job, between_chunks=lambda: drain_pending_fetches(stdout))
+            if stdout:
+                stdout.write(f"Finished {job}: {job.done} checked, {job.failed} failed")
+            continue
+        if once:
+            return
+        reset_interrupted_fetches()
+        time.sleep(poll_interval)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.history import archive_history_batch, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves price history rows older than PRICE_HISTORY_RETENTION_DAYS into compressed '
+        'per-product archives, in short batched transactions. Safe to interrupt and re-run; '
+        'hourly/daily rollups are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Archive rows last seen more than this many days ago (default: PRICE_HISTORY_RETENTION_DAYS).',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows archived per transaction.')
+        parser.add_argument(
+            '--max-batches', type=int,
+            help='Stop after this many batches; the next run continues from there.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches to let other writers through.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        if cutoff is None:
+            raise CommandError("Retention is disabled (PRICE_HISTORY_RETENTION_DAYS is 0).")
+        batch_size = max(1, options['batch_size'])
+
+        self.stdout.write(f"Archiving price history last seen before {cutoff:%Y-%m-%d %H:%M}")
+        total = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            archived = archive_history_batch(cutoff, batch_size)
+            if not archived:
+                break
+            total += archived
+            batches += 1
+            self.stdout.write(f"Archived {total} rows")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f"Done: {total} rows archived in {batches} batches")
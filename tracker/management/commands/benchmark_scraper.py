@@ -0,0 +1,147 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.corpus import FixtureAdapter, load_manifest, read_page
+from tracker.scraper import (
+    clean_price, extract_product_details, get_parser_backend, get_product_details,
+    search_amazon, search_flipkart, search_products, sessions,
+)
+
+# Product URL the extractor sees for an extra saved page, picked by file name prefix
+SAMPLE_URLS = {
+    'amazon': 'https://www.amazon.in/dp/BENCHMARK',
+    'flipkart': 'https://www.flipkart.com/product/p/itmBENCHMARK',
+    'myntra': 'https://www.myntra.com/benchmark/1',
+}
+
+PRICE_STRINGS = [
+    '₹69,900.00', '₹ 1,499', '$19.99', '€ 1.299,00', '£45', '1,299', '69,900', 'Rs. 100', '', None,
+]
+
+SEARCH_SOURCES = {'Amazon': search_amazon, 'Flipkart': search_flipkart}
+
+
+def sample_url(path):
+    for prefix, url in SAMPLE_URLS.items():
+        if path.name.startswith(prefix):
+            return url
+    return 'https://example.com/product'
+
+
+def measure(func, items, repeat):
+    """Times func over every item `repeat` times, then measures peak memory over one pass."""
+    timings = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for item in items:
+        func(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings_ms = [t * 1000 for t in timings]
+    return {
+        'calls': len(timings),
+        'per_sec': len(timings) / sum(timings) if sum(timings) else 0.0,
+        'p50_ms': statistics.median(timings_ms),
+        'p95_ms': statistics.quantiles(timings_ms, n=20)[-1] if len(timings_ms) > 1 else timings_ms[0],
+        'peak_kib': peak / 1024,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the scraper offline against the saved page corpus (tracker/testdata/pages) '
+        'through a stub transport, reporting throughput, p50/p95 latency and peak memory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Extra saved HTML product pages (or directories) to include in the parser comparison.',
+        )
+        parser.add_argument('--repeat', type=int, default=10, help='Passes over the corpus per benchmark.')
+        parser.add_argument('--save-baseline', metavar='FILE', help='Write results as JSON for later comparison.')
+        parser.add_argument('--baseline', metavar='FILE', help='Compare results against a saved baseline.')
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        manifest = load_manifest()
+        products = manifest['product']
+        searches = manifest['search']
+
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline: {e}")
+
+        self.stdout.write(f"Parser backend: {get_parser_backend()}  |  {len(products)} product pages, "
+                          f"{len(searches)} search pages, {repeat} passes")
+
+        results = {}
+        with sessions.using_adapter(FixtureAdapter(manifest)):
+            results['get_product_details'] = measure(
+                lambda entry: get_product_details(entry['url']), products, repeat)
+            results['extract (html.parser, full)'] = measure(
+                lambda entry: extract_product_details(read_page(entry), entry['url'], parser='html.parser', restricted=False),
+                products, repeat)
+            results['clean_price'] = measure(clean_price, PRICE_STRINGS, repeat * 10)
+            for entry in searches:
+                search = SEARCH_SOURCES[entry['source']]
+                results[f"search_{entry['source'].lower()}"] = measure(
+                    lambda entry: search(entry['query']), [entry], repeat)
+            results['search_products'] = measure(
+                lambda query: search_products(query), sorted({entry['query'] for entry in searches}), repeat)
+
+        self.write_results(results, baseline)
+        self.compare_parsers(products, options['paths'], repeat)
+
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+    def write_results(self, results, baseline):
+        header = f"{'benchmark':<30} {'calls/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'peak KiB':>10}"
+        if baseline:
+            header += f" {'p50 vs base':>12}"
+        self.stdout.write(header)
+        for name, r in results.items():
+            line = f"{name:<30} {r['per_sec']:>10.1f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['peak_kib']:>10.1f}"
+            if baseline and name in baseline and baseline[name]['p50_ms']:
+                change = (r['p50_ms'] - baseline[name]['p50_ms']) / baseline[name]['p50_ms'] * 100
+                line += f" {change:>+11.1f}%"
+            self.stdout.write(line)
+
+    def compare_parsers(self, products, extra_paths, repeat):
+        """Full html.parser extraction vs the default restricted path, page by page."""
+        pages = [(entry['file'], read_page(entry), entry['url']) for entry in products]
+        for name in extra_paths:
+            path = Path(name)
+            if not path.exists():
+                raise CommandError(f"{path} does not exist")
+            files = sorted(path.glob('*.html')) if path.is_dir() else [path]
+            pages.extend((f.name, f.read_bytes(), sample_url(f)) for f in files)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'page':<40} {'full ms':>9} {'fast ms':>9} {'speedup':>8}  match")
+        for name, content, url in pages:
+            full_ms = measure(
+                lambda _: extract_product_details(content, url, parser='html.parser', restricted=False), [None], repeat
+            )['p50_ms']
+            fast_ms = measure(lambda _: extract_product_details(content, url), [None], repeat)['p50_ms']
+            full = extract_product_details(content, url, parser='html.parser', restricted=False)
+            fast = extract_product_details(content, url)
+            self.stdout.write(
+                f"{name:<40} {full_ms:>9.2f} {fast_ms:>9.2f} {full_ms / fast_ms:>7.1f}x  {'yes' if full == fast else 'NO'}"
+            )
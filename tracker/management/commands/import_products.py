@@ -0,0 +1,63 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from tracker.imports import ImportFormatError, create_import, import_status, parse_import
+from tracker.jobs import fetch_pending_products, reset_interrupted_fetches
+from tracker.models import ImportJob, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports (url, target_price) rows from a CSV or JSON file for a user. Duplicate and '
+        'already-tracked URLs are skipped; new products are fetched by the refresh_prices worker, '
+        'or in this process with --fetch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (url,target_price) or JSON file; - reads stdin.')
+        parser.add_argument('--user', required=True, help='Username or email of the owner.')
+        parser.add_argument(
+            '--format', choices=['csv', 'json'],
+            help='Input format (default: detected from the content).',
+        )
+        parser.add_argument(
+            '--fetch', action='store_true',
+            help='Scrape pending products now instead of leaving them to the worker.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(Q(username=options['user']) | Q(email__iexact=options['user']))
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}")
+        except User.MultipleObjectsReturned:
+            raise CommandError(f"Several users match {options['user']!r}; use the username")
+
+        content_type = {'csv': 'text/csv', 'json': 'application/json'}.get(options['format'], '')
+        try:
+            if options['path'] == '-':
+                content = sys.stdin.buffer.read()
+            else:
+                with open(options['path'], 'rb') as f:
+                    content = f.read()
+            items = parse_import(content, content_type)
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        job = create_import(user, items, source=ImportJob.SOURCE_COMMAND)
+        self.stdout.write(f"Created {job}: {import_status(job, include_rows=False)['counts']}")
+        for row in import_status(job)['rows']:
+            if row['status'] == 'invalid':
+                self.stdout.write(f"  line {row['line']}: {row['error']}")
+
+        if options['fetch']:
+            # Only this import's products; anything else is left to the worker
+            products = Product.objects.filter(pk__in=job.rows.values('product'))
+            reset_interrupted_fetches(products)
+            while fetch_pending_products(products=products):
+                status = import_status(job, include_rows=False)
+                self.stdout.write(f"Fetching: {status['counts']}")
+            self.stdout.write(f"Finished {job}: {import_status(job, include_rows=False)['counts']}")
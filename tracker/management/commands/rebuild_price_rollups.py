@@ -0,0 +1,51 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+from tracker.history import archived_history, history_observations, update_rollups
+from tracker.models import PriceHistory, PriceRollup, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds hourly/daily price rollups from stored and archived price history. The refresh '
+        'pipeline keeps them current; run this once for history recorded before rollups existed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Only rebuild these products.')
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only rebuild products with price history older than their first rollup, i.e. recorded '
+                 'before rollups existed. Cheap enough to run on every deploy.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Products rebuilt per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+        if options['missing']:
+            history = PriceHistory.objects.filter(product=OuterRef('pk'))
+            products = products.annotate(first_bucket=Subquery(
+                PriceRollup.objects.filter(product=OuterRef('pk'), resolution=PriceRollup.RESOLUTION_HOUR)
+                .order_by('bucket').values('bucket')[:1]
+            )).filter(
+                Q(Exists(history), first_bucket__isnull=True)
+                | Exists(history.filter(timestamp__lt=OuterRef('first_bucket')))
+            )
+        product_ids = list(products.order_by('pk').values_list('pk', flat=True))
+        batch_size = max(1, options['batch_size'])
+
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            rows = PriceHistory.objects.filter(product_id__in=batch).select_related('product').order_by('timestamp', 'pk')
+            with transaction.atomic():
+                PriceRollup.objects.filter(product_id__in=batch).delete()
+                update_rollups(list(history_observations(chain(archived_history(batch), rows))))
+            self.stdout.write(f"Rebuilt rollups for {min(start + batch_size, len(product_ids))}/{len(product_ids)} products")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from tracker.jobs import enqueue_refresh, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs the background worker that fetches newly viewed/added products and consumes queued price refresh jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process pending fetches and queued jobs, then exit instead of polling forever.',
+        )
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help='Queue a refresh of all active products before processing (useful from cron).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=5,
+            help='Seconds to wait between polls when the queue is empty.',
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = enqueue_refresh()
+            self.stdout.write(f"Queued {job}")
+        run_worker(poll_interval=options['poll_interval'], once=options['once'], stdout=self.stdout)
@@ -0,0 +1,235 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('tracker.metrics')
+
+# Per-process request metrics, filled in by tracker.middleware.MetricsMiddleware
+# for a sampled fraction of requests (METRICS_SAMPLE_RATE) and exported in
+# Prometheus text format by the metrics view. Unsampled requests only pay
+# for a contextvar lookup at each instrumented call.
+
+# Latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The sample being recorded for the current request, if it is sampled
+current_sample = contextvars.ContextVar('tracker_metrics_sample', default=None)
+
+
+def get_sample_rate():
+    return getattr(settings, 'METRICS_SAMPLE_RATE', 0)
+
+
+class RequestSample:
+    """Timings collected while one sampled request is handled."""
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.scraper_time = 0.0
+        self.scraper_calls = {}
+        self.template_time = 0.0
+        # Nesting depth of timed calls, so inner calls aren't counted twice
+        self.scraper_depth = 0
+        self.template_depth = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.queries.append((duration, sql))
+
+    def top_queries(self, count):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+
+
+def timed_scraper(func):
+    """Adds the time spent in func to the current request's scraper time."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        sample = current_sample.get()
+        if sample is None or sample.scraper_depth:
+            return func(*args, **kwargs)
+        sample.scraper_depth += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            sample.scraper_depth -= 1
+            sample.scraper_time += duration
+            calls, total = sample.scraper_calls.get(func.__name__, (0, 0.0))
+            sample.scraper_calls[func.__name__] = (calls + 1, total + duration)
+    return wrapper
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        sample = current_sample.get()
+        if sample is None or sample.template_depth:
+            return super().render(context, request)
+        sample.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_depth -= 1
+            sample.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for sampled requests."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Thread-safe per-view aggregates of sampled requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}
+        self.requests = {}
+        self.db_queries = {}
+        self.db_time = {}
+        self.template_time = {}
+        self.scraper_calls = {}
+        self.scraper_time = {}
+        self.slow_requests = {}
+
+    def record(self, view, method, status, duration, sample, slow):
+        with self._lock:
+            self.latency.setdefault((view, method), Histogram()).observe(duration)
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.db_queries[view] = self.db_queries.get(view, 0) + len(sample.queries)
+            self.db_time[view] = self.db_time.get(view, 0.0) + sample.db_time
+            self.template_time[view] = self.template_time.get(view, 0.0) + sample.template_time
+            for function, (calls, total) in sample.scraper_calls.items():
+                key = (view, function)
+                self.scraper_calls[key] = self.scraper_calls.get(key, 0) + calls
+                self.scraper_time[key] = self.scraper_time.get(key, 0.0) + total
+            if slow:
+                self.slow_requests[view] = self.slow_requests.get(view, 0) + 1
+
+    def render(self):
+        """The metrics in Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+
+            def family(name, kind, help_text):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            def line(name, labels, value):
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+            family('tracker_request_duration_seconds', 'histogram', 'Latency of sampled requests.')
+            for (view, method), histogram in sorted(self.latency.items()):
+                labels = {'view': view, 'method': method}
+                for bound, count in histogram.cumulative():
+                    line('tracker_request_duration_seconds_bucket', dict(labels, le=format_value(bound)), count)
+                line('tracker_request_duration_seconds_bucket', dict(labels, le='+Inf'), histogram.count)
+                line('tracker_request_duration_seconds_sum', labels, histogram.sum)
+                line('tracker_request_duration_seconds_count', labels, histogram.count)
+
+            family('tracker_requests_total', 'counter', 'Sampled requests by response status.')
+            for (view, method, status), count in sorted(self.requests.items()):
+                line('tracker_requests_total', {'view': view, 'method': method, 'status': status}, count)
+
+            per_view = [
+                ('tracker_db_queries_total', 'SQL queries run by sampled requests.', self.db_queries),
+                ('tracker_db_query_seconds_total', 'Time spent in SQL queries by sampled requests.', self.db_time),
+                ('tracker_template_render_seconds_total', 'Time spent rendering templates by sampled requests.', self.template_time),
+                ('tracker_slow_requests_total', 'Sampled requests slower than METRICS_SLOW_REQUEST_MS.', self.slow_requests),
+            ]
+            for name, help_text, values in per_view:
+                family(name, 'counter', help_text)
+                for view, value in sorted(values.items()):
+                    line(name, {'view': view}, value)
+
+            family('tracker_scraper_calls_total', 'counter', 'tracker.scraper calls made by sampled requests.')
+            for (view, function), count in sorted(self.scraper_calls.items()):
+                line('tracker_scraper_calls_total', {'view': view, 'function': function}, count)
+            family('tracker_scraper_seconds_total', 'counter', 'Time spent in tracker.scraper by sampled requests.')
+            for (view, function), total in sorted(self.scraper_time.items()):
+                line('tracker_scraper_seconds_total', {'view': view, 'function': function}, total)
+
+        # Imported here: tracker.cache imports the scraper, which imports this module
+        from .cache import search_stats
+        stats = search_stats.as_dict()
+        family('tracker_search_cache_requests_total', 'counter', 'Alternative-price search cache lookups (all requests).')
+        line('tracker_search_cache_requests_total', {'result': 'hit'}, stats['hits'])
+        line('tracker_search_cache_requests_total', {'result': 'miss'}, stats['misses'])
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+
+def log_slow_request(request, view, duration, sample):
+    top = getattr(settings, 'METRICS_SLOW_REQUEST_TOP_QUERIES', 5)
+    queries = "".join(
+        f"\n  {query_time * 1000:8.1f} ms  {' '.join(sql.split())[:300]}"
+        for query_time, sql in sample.top_queries(top)
+    )
+    logger.warning(
+        "Slow request %s %s (%s): %.0f ms; %d queries in %.0f ms, templates %.0f ms, scraper %.0f ms%s",
+        request.method, request.path, view, duration * 1000, len(sample.queries), sample.db_time * 1000,
+        sample.template_time * 1000, sample.scraper_time * 1000, queries,
+    )
@@ -0,0 +1,46 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import RequestSample, current_sample, get_sample_rate, log_slow_request, registry
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL, template and scraper time for a random
+    METRICS_SAMPLE_RATE fraction of requests into tracker.metrics, and logs
+    sampled requests slower than METRICS_SLOW_REQUEST_MS with their top
+    queries. Unsampled requests pass straight through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = get_sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        sample = RequestSample()
+        token = current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 1000)
+        slow = bool(slow_ms) and duration * 1000 >= slow_ms
+        registry.record(view, request.method, response.status_code, duration, sample, slow)
+        if slow:
+            log_slow_request(request, view, duration, sample)
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_seen(apps, schema_editor):
+    # Existing rows are single observations
+    PriceHistory = apps.get_model('tracker', 'PriceHistory')
+    PriceHistory.objects.update(last_seen=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricehistory',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='pricehistory',
+            name='observations',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def backfill_price_stats(apps, schema_editor):
+    # History may still hold one row per observation (written before
+    # change-only storage), so changes are counted by walking each product's
+    # rows in order. The 30-day average needs daily rollups, so products
+    # without them get theirs on the next refresh
+    Product = apps.get_model('tracker', 'Product')
+    PriceHistory = apps.get_model('tracker', 'PriceHistory')
+    PriceRollup = apps.get_model('tracker', 'PriceRollup')
+    fields = ['lowest_price', 'highest_price', 'avg_price_30d', 'price_changed_at', 'price_change_count']
+
+    averages = {
+        row['product_id']: (row['price_sum'] / row['count']).quantize(Decimal('0.01'))
+        for row in PriceRollup.objects.filter(
+            resolution='day', bucket__gte=timezone.now() - timedelta(days=30),
+        ).values('product_id').annotate(price_sum=Sum('price_sum'), count=Sum('count'))
+        if row['count']
+    }
+
+    products = []
+    product = previous = None
+    rows = PriceHistory.objects.order_by('product_id', 'timestamp', 'pk').values_list('product_id', 'price', 'timestamp')
+    for product_id, price, timestamp in rows.iterator(chunk_size=2000):
+        if product is None or product.pk != product_id:
+            if len(products) >= 500:
+                Product.objects.bulk_update(products, fields)
+                products = []
+            product = Product(
+                pk=product_id, lowest_price=price, highest_price=price,
+                avg_price_30d=averages.get(product_id), price_changed_at=timestamp, price_change_count=0,
+            )
+            products.append(product)
+        else:
+            product.lowest_price = min(product.lowest_price, price)
+            product.highest_price = max(product.highest_price, price)
+            if price != previous:
+                product.price_change_count += 1
+                product.price_changed_at = timestamp
+        previous = price
+    if products:
+        Product.objects.bulk_update(products, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_pricerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_price_30d',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='highest_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='lowest_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_change_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_price_stats, migrations.RunPython.noop),
+    ]
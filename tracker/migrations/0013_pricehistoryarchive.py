@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_product_price_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_archives', to='tracker.product')),
+            ],
+            options={
+                'ordering': ['start'],
+                'indexes': [models.Index(fields=['product', 'start'], name='tracker_historyarchive_start')],
+            },
+        ),
+    ]
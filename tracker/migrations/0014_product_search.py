@@ -0,0 +1,79 @@
+from django.db import migrations, OperationalError
+
+
+SQLITE_FORWARD = [
+    # External-content FTS5 index over tracker_product.name; prefix indexes
+    # keep 2- and 3-character live-search prefixes fast
+    """
+    CREATE VIRTUAL TABLE tracker_product_fts USING fts5(
+        name, content='tracker_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER tracker_product_fts_insert AFTER INSERT ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_product_fts_delete AFTER DELETE ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(tracker_product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_product_fts_update AFTER UPDATE OF name ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(tracker_product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO tracker_product_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    "INSERT INTO tracker_product_fts(tracker_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS tracker_product_fts_insert",
+    "DROP TRIGGER IF EXISTS tracker_product_fts_delete",
+    "DROP TRIGGER IF EXISTS tracker_product_fts_update",
+    "DROP TABLE IF EXISTS tracker_product_fts",
+]
+
+
+def postgres_search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Must match the SearchVector used by tracker.search
+    return GinIndex(SearchVector('name', config='simple'), name='tracker_product_name_search')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FORWARD[0])
+        except OperationalError:
+            # SQLite built without FTS5: tracker.search falls back to icontains
+            return
+        for statement in SQLITE_FORWARD[1:]:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('tracker', 'Product'), postgres_search_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('tracker', 'Product'), postgres_search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0013_pricehistoryarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fetch_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='fetch_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('fetching', 'Fetching'), ('ok', 'OK'), ('failed', 'Failed')], default='ok', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('fetch_status', 'pending')), fields=['created_at'], name='tracker_product_fetch_pending'),
+        ),
+    ]
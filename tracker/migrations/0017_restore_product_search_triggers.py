@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+# SQLite implements AddField on tracker_product (0015) by rebuilding the
+# table, which drops the triggers 0014 created to keep tracker_product_fts
+# in sync. Recreate them and reindex the names changed in between. Any later
+# migration that rebuilds tracker_product must do the same.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS tracker_product_fts_insert AFTER INSERT ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tracker_product_fts_delete AFTER DELETE ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(tracker_product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tracker_product_fts_update AFTER UPDATE OF name ON tracker_product BEGIN
+        INSERT INTO tracker_product_fts(tracker_product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO tracker_product_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if 'tracker_product_fts' not in connection.introspection.table_names(cursor):
+            # SQLite built without FTS5: tracker.search falls back to icontains
+            return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+    schema_editor.execute("INSERT INTO tracker_product_fts(tracker_product_fts) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0016_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
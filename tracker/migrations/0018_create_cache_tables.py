@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+# The 'summary' cache defaults to DatabaseCache, so its table must exist
+# before the dashboard is served. createcachetable skips tables that
+# already exist; if CACHES changes later, run it again by hand.
+def create_cache_tables(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0017_restore_product_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0018_create_cache_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fetch_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
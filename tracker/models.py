@@ -1,8 +1,50 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, F, Q, Sum
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+class ProductQuerySet(models.QuerySet):
+    # Mirrors Product.is_below_threshold
+    DEAL = Q(current_price__isnull=False, current_price__lte=F('target_price'))
+
+    def deals(self):
+        """Products priced at or below their target."""
+        return self.filter(self.DEAL)
+
+    def deal_stats(self):
+        """
+        Product count, deal count and total savings (target minus current
+        price over deals with both prices set) in a single aggregate query.
+        """
+        stats = self.aggregate(
+            total=Count('id'),
+            deals=Count('id', filter=self.DEAL),
+            savings=Sum(
+                F('target_price') - F('current_price'),
+                filter=self.DEAL & ~Q(current_price=0) & ~Q(target_price=0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        # SQLite returns the sum unscaled; match the two-place prices it adds up
+        stats['savings'] = stats['savings'].quantize(Decimal('0.01')) if stats['savings'] is not None else 0
+        return stats
+
 class Product(models.Model):
+    # fetch_status tracks scrapes queued for the background worker (see
+    # jobs.fetch_pending_products); products never wait on the request thread
+    FETCH_PENDING = 'pending'
+    FETCH_RUNNING = 'fetching'
+    FETCH_OK = 'ok'
+    FETCH_FAILED = 'failed'
+    FETCH_STATUS_CHOICES = [
+        (FETCH_PENDING, 'Pending'),
+        (FETCH_RUNNING, 'Fetching'),
+        (FETCH_OK, 'OK'),
+        (FETCH_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=255)
     url = models.URLField()
@@ -13,10 +55,54 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     last_checked = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # HTTP validators and page fingerprint from the last successful scrape
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=64, blank=True, default='')
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # Price statistics kept current by history.record_prices
+    lowest_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    highest_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    avg_price_30d = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_changed_at = models.DateTimeField(null=True, blank=True)
+    price_change_count = models.PositiveIntegerField(default=0)
+    fetch_status = models.CharField(max_length=10, choices=FETCH_STATUS_CHOICES, default=FETCH_OK)
+    fetch_error = models.TextField(blank=True)
+    # When a worker last claimed the product for a fetch; also the claim's
+    # lease (see jobs.claim_pending_products and jobs.reset_interrupted_fetches)
+    fetch_claimed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Per-user product lists, newest first
+            models.Index(fields=['user', '-created_at'], name='tracker_product_user_created'),
+            # Refresh sweep over active products, stalest first. Partial rather
+            # than (is_active, last_checked): Django filters booleans as a bare
+            # column, which SQLite can only match against an index condition.
+            models.Index(fields=['last_checked'], condition=Q(is_active=True), name='tracker_product_active_checked'),
+            # Worker sweep for products waiting on a scrape
+            models.Index(fields=['created_at'], condition=Q(fetch_status='pending'), name='tracker_product_fetch_pending'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def validators(self):
+        """Validators for a conditional re-fetch, or None if there is no price to keep."""
+        if self.current_price is None:
+            return None
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'content_hash': self.content_hash,
+        }
+
+    @property
+    def is_fetching(self):
+        return self.fetch_status in (self.FETCH_PENDING, self.FETCH_RUNNING)
+
     @property
     def is_below_threshold(self):
         if self.current_price is not None:
@@ -27,6 +113,10 @@ class PriceHistory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp = models.DateTimeField(default=timezone.now)
+    # Last time this price was observed and how many times in a row; with
+    # PRICE_HISTORY_MODE='changes' a row covers a run of identical prices
+    last_seen = models.DateTimeField(default=timezone.now)
+    observations = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return f"{self.product.name} - {self.price} at {self.timestamp}"
@@ -34,3 +124,143 @@ class PriceHistory(models.Model):
     class Meta:
         ordering = ['-timestamp']
         verbose_name_plural = 'Price History'
+        indexes = [
+            # A product's history in time order, and its min/max price
+            models.Index(fields=['product', 'timestamp'], name='tracker_pricehistory_prod_ts'),
+        ]
+
+class PriceHistoryArchive(models.Model):
+    """
+    PriceHistory rows past the retention period, packed into one
+    zlib-compressed columnar blob per product and archive batch (see
+    history.pack_history).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='history_archives')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    row_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.product.name} history {self.start:%Y-%m-%d} to {self.end:%Y-%m-%d}"
+
+    class Meta:
+        ordering = ['start']
+        indexes = [
+            models.Index(fields=['product', 'start'], name='tracker_historyarchive_start'),
+        ]
+
+class PriceRollup(models.Model):
+    """Open/high/low/close of a product's observed prices over one hour or day."""
+    RESOLUTION_HOUR = 'hour'
+    RESOLUTION_DAY = 'day'
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_HOUR, 'Hourly'),
+        (RESOLUTION_DAY, 'Daily'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    # Start of the hour/day, in the site's TIME_ZONE
+    bucket = models.DateTimeField()
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.product.name} {self.resolution} {self.bucket}"
+
+    @property
+    def average(self):
+        return self.price_sum / self.count if self.count else None
+
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'resolution', 'bucket'], name='tracker_pricerollup_unique_bucket'),
+        ]
+
+class RefreshJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Refresh #{self.pk} ({self.status})"
+
+    @property
+    def remaining(self):
+        return max(0, self.total - self.done - self.failed)
+
+    class Meta:
+        ordering = ['-created_at']
+
+class ImportJob(models.Model):
+    """A bulk import of URLs; per-URL outcomes are its ImportRows."""
+    SOURCE_API = 'api'
+    SOURCE_COMMAND = 'command'
+    SOURCE_CHOICES = [
+        (SOURCE_API, 'API'),
+        (SOURCE_COMMAND, 'Command'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=SOURCE_API)
+    total = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.total} rows)"
+
+    class Meta:
+        ordering = ['-created_at']
+
+class ImportRow(models.Model):
+    """
+    One input line of an ImportJob. Rows that created a product report that
+    product's fetch_status as their progress (see imports.row_status).
+    """
+    STATUS_CREATED = 'created'
+    STATUS_DUPLICATE = 'duplicate'
+    STATUS_INVALID = 'invalid'
+    STATUS_CHOICES = [
+        (STATUS_CREATED, 'Created'),
+        (STATUS_DUPLICATE, 'Duplicate'),
+        (STATUS_INVALID, 'Invalid'),
+    ]
+
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='rows')
+    line = models.PositiveIntegerField()
+    url = models.TextField()
+    target_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    # The product created for the row, or the existing one it duplicates
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.job} line {self.line}: {self.status}"
+
+    class Meta:
+        ordering = ['line']
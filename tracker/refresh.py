@@ -0,0 +1,238 @@
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_deal_summaries
+from .history import PRODUCT_STATS_FIELDS, record_prices
+from .models import Product
+from .scraper import get_product_details, get_marketplace
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_TITLES = ["Add to your order", "Amazon.in", "Shopping Cart", "Page Not Found", "Unknown Product"]
+
+# Outcomes of writing one scrape result back
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_DOMAIN_LIMIT = 2
+DEFAULT_BATCH_SIZE = 100
+
+# Product columns a refresh can change; the rest of the row is never rewritten
+REFRESH_FIELDS = [
+    'current_price', 'image_url', 'currency', 'name', 'last_checked',
+    'etag', 'last_modified', 'content_hash', 'fetch_status', 'fetch_error',
+]
+
+
+def get_domain_limit(marketplace):
+    """Max concurrent fetches allowed against a single marketplace."""
+    limits = getattr(settings, 'PRICE_REFRESH_DOMAIN_LIMITS', {})
+    default = getattr(settings, 'PRICE_REFRESH_DEFAULT_DOMAIN_LIMIT', DEFAULT_DOMAIN_LIMIT)
+    return max(1, limits.get(marketplace, default))
+
+
+def fetch_concurrently(products, max_workers=None):
+    """
+    Fetches product pages concurrently and yields (product, details) as each
+    fetch completes.
+
+    Every marketplace gets its own lane of workers sized by its domain limit,
+    so a slow marketplace never holds up the others, and a global semaphore
+    caps the number of requests in flight across all lanes.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'PRICE_REFRESH_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    global_slots = threading.BoundedSemaphore(max(1, max_workers))
+
+    def fetch(product):
+        with global_slots:
+            return get_product_details(product.url, validators=product.validators)
+
+    lanes = defaultdict(list)
+    for product in products:
+        lanes[get_marketplace(product.url)].append(product)
+
+    executors = []
+    futures = {}
+    try:
+        for marketplace, items in lanes.items():
+            executor = ThreadPoolExecutor(
+                max_workers=min(get_domain_limit(marketplace), len(items)),
+                thread_name_prefix=f'refresh-{marketplace}',
+            )
+            executors.append(executor)
+            for product in items:
+                futures[executor.submit(fetch, product)] = product
+
+        for future in as_completed(futures):
+            product = futures[future]
+            try:
+                details = future.result()
+            except Exception as e:
+                details = {'title': None, 'price': None, 'currency': '$', 'image_url': None, 'error': str(e)}
+            yield product, details
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def apply_details(product, details):
+    """
+    Applies freshly scraped details to a product in memory; nothing is
+    saved. Returns UPDATED, UNCHANGED (page matched the last scrape, so
+    only the check time and validators move) or FAILED.
+    """
+    if details.get('unchanged'):
+        apply_validators(product, details.get('validators'))
+        mark_checked(product)
+        return UNCHANGED
+    if details['error'] or not details['price']:
+        return FAILED
+
+    product.current_price = details['price']
+    if details.get('image_url'):
+        product.image_url = details['image_url']
+
+    if details.get('currency'):
+        product.currency = details['currency']
+
+    # Only update title if it's valid and not in blacklist
+    new_title = details.get('title')
+    if new_title and new_title not in BLACKLIST_TITLES:
+        product.name = new_title
+
+    apply_validators(product, details.get('validators'))
+    mark_checked(product)
+    return UPDATED
+
+
+def apply_validators(product, validators):
+    validators = validators or {}
+    product.etag = validators.get('etag', '')
+    product.last_modified = validators.get('last_modified', '')
+    product.content_hash = validators.get('content_hash', '')
+
+
+def mark_checked(product):
+    product.last_checked = timezone.now()
+    product.fetch_status = Product.FETCH_OK
+    product.fetch_error = ''
+
+
+class RefreshWriter:
+    """
+    Buffers checked products and writes them back in batches: one
+    transaction per batch holding the batch's price observations (see
+    history.record_prices) and a bulk_update of REFRESH_FIELDS plus the
+    price stats. Unchanged pages count as an observation of the current
+    price, so last_seen, observations and the rollups keep up with every
+    check. Once a batch is committed, the owners' cached deal summaries are
+    invalidated and price-drop emails go out for updated products. Use as a
+    context manager so the last, partial batch is flushed.
+    """
+
+    def __init__(self, batch_size=None):
+        if batch_size is None:
+            batch_size = getattr(settings, 'PRICE_REFRESH_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.batch_size = max(1, batch_size)
+        self.products = []
+        self.unchanged = []
+        self.history = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def add(self, product, details):
+        """Applies details to product, buffering it unless it failed. Returns the outcome."""
+        outcome = apply_details(product, details)
+        if outcome == UPDATED:
+            self.products.append(product)
+            self.history.append((product, details['price'], product.last_checked))
+        elif outcome == UNCHANGED:
+            self.unchanged.append(product)
+            if product.current_price is not None:
+                self.history.append((product, product.current_price, product.last_checked))
+        if len(self.products) + len(self.unchanged) >= self.batch_size:
+            self.flush()
+        return outcome
+
+    def flush(self):
+        if not self.products and not self.unchanged:
+            return
+        products, unchanged, history = self.products, self.unchanged, self.history
+        self.products, self.unchanged, self.history = [], [], []
+
+        with transaction.atomic():
+            # Stats are computed in memory so one bulk_update saves both
+            record_prices(history, save_stats=False)
+            Product.objects.bulk_update(products + unchanged, REFRESH_FIELDS + PRODUCT_STATS_FIELDS)
+        if not products:
+            return
+        # bulk_update sends no post_save signals
+        invalidate_deal_summaries(product.user_id for product in products)
+
+        for product in products:
+            notify_price_drop(product)
+
+
+def notify_price_drop(product):
+    """Emails the product owner if the price is at or below their target."""
+    if not product.is_below_threshold:
+        logger.debug("Product %s is not below threshold (current %s, target %s)",
+                     product.pk, product.current_price, product.target_price)
+        return
+
+    logger.info("Product %s is below threshold (current %s, target %s)",
+                product.pk, product.current_price, product.target_price)
+
+    # Send to the product owner if they exist and have an email
+    if not (product.user and product.user.email):
+        logger.info("No user email for product %s, skipping price drop email", product.pk)
+        return
+
+    subject = f"Price Drop Alert: {product.name}"
+    message = f"Good news! The price for {product.name} has dropped to {product.current_price}. This is below your target of {product.target_price}.\n\nCheck it out here: {product.url}"
+    try:
+        send_mail(subject, message, settings.EMAIL_HOST_USER, [product.user.email])
+        logger.info("Sent price drop email for product %s", product.pk)
+    except Exception:
+        logger.exception("Failed to send price drop email for product %s", product.pk)
+
+
+def refresh_products(products, max_workers=None, progress=None):
+    """
+    Refreshes prices for the given products, writing results back in batches
+    of PRICE_REFRESH_BATCH_SIZE as fetches complete. Returns a dict of UPDATED/UNCHANGED/FAILED counts
+    plus 'errors', a list of (product, message) tuples.
+
+    If given, progress(done_count, failed_count) is called after every
+    result, where done counts both updated and unchanged products.
+    """
+    # Evaluate up front so worker threads never touch the database
+    products = list(products)
+    counts = {UPDATED: 0, UNCHANGED: 0, FAILED: 0}
+    errors = []
+
+    with RefreshWriter() as writer:
+        for product, details in fetch_concurrently(products, max_workers=max_workers):
+            outcome = writer.add(product, details)
+            counts[outcome] += 1
+            if outcome == FAILED and details['error']:
+                errors.append((product, details['error']))
+            if progress:
+                progress(counts[UPDATED] + counts[UNCHANGED], counts[FAILED])
+
+    counts['errors'] = errors
+    return counts
@@ -1,9 +1,21 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.filter import ElementFilter
+from django.conf import settings
+from .extractors import Strategy, SiteExtractor, ExtractorRegistry
+from .metrics import timed_scraper
 import random
 import re
+import contextlib
 import json
+import html
+import functools
+import hashlib
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -22,12 +34,155 @@ BLACKLIST_TITLES = [
     "Welcome to Amazon",
 ]
 
+# Marketplace -> hostnames that belong to it (short links included)
+MARKETPLACES = {
+    'amazon.in': ('amazon.in', 'amazon.com', 'amzn.in', 'amzn.to'),
+    'flipkart.com': ('flipkart.com', 'dl.flipkart.com'),
+    'myntra.com': ('myntra.com',),
+}
+
+def get_marketplace(url):
+    """Returns the marketplace key for a URL, or its hostname if unknown."""
+    host = (urllib.parse.urlsplit(url or '').hostname or '').lower()
+    for marketplace, hosts in MARKETPLACES.items():
+        for known in hosts:
+            if host == known or host.endswith('.' + known):
+                return marketplace
+    return host
+
+class SessionPool:
+    """
+    Keeps one keep-alive requests.Session per marketplace so repeated fetches
+    reuse TCP/TLS connections and the marketplace's cookies.
+
+    Sessions are shared between threads: each is only configured once, when
+    created, after which the urllib3 connection pool and the cookie jar (both
+    internally locked) are the only state that changes. pool_block=True caps
+    open connections per host at SCRAPER_POOL_MAXSIZE; extra callers wait for
+    a free connection instead of opening throwaway ones.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._adapter = None
+
+    def get(self, url):
+        marketplace = get_marketplace(url)
+        session = self._sessions.get(marketplace)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(marketplace)
+                if session is None:
+                    session = self._sessions[marketplace] = self._create_session()
+        return session
+
+    def _create_session(self):
+        adapter = self._adapter
+        if adapter is None:
+            pool_maxsize = getattr(settings, 'SCRAPER_POOL_MAXSIZE', 8)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    @contextlib.contextmanager
+    def using_adapter(self, adapter):
+        """Routes every fetch through `adapter` (e.g. a stub transport) while active."""
+        with self._lock:
+            saved_sessions, self._sessions = self._sessions, {}
+            self._adapter = adapter
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._sessions = saved_sessions
+                self._adapter = None
+
+sessions = SessionPool()
+
+def fetch(url, timeout, headers=None):
+    """GETs a URL through the marketplace's pooled session."""
+    request_headers = get_headers(url)
+    if headers:
+        request_headers.update(headers)
+    return sessions.get(url).get(url, headers=request_headers, timeout=timeout)
+
+# Page regions that decide title/price/image: every tag, meta and embedded
+# value the extractors read. Everything else on a product page
+# (recommendations, ads, session tokens) changes on every load and is left
+# out of the fingerprint. The 'price' group marks regions a price can come from.
+FINGERPRINT_REGEX = re.compile(
+    # Skips positions no alternative can start at without trying each one
+    rb'(?=[<"&$\xe2\xc2r])(?:'
+    rb'<title[^>]*>[^<]*'
+    rb'|<h1[^>]*>[^<]*'
+    rb'|<meta[^>]*(?:og:title|og:image)[^>]*>'
+    rb'|<[^>]*\bid="(?:productTitle|title|ebooksProductTitle|landingImage|imgBlkFront|main-image'
+    rb'|ebooksImgBlkFront|imgTagWrapperId)"[^>]*>[^<]*'
+    rb'|<img[^>]*\bclass="[^"]*a-dynamic-image[^"]*"[^>]*>'
+    rb'|(?P<price><meta[^>]*price[^>]*>'
+    # Price containers with their nested text (class strategies read the
+    # element's whole text), up to the first closing tag of the same name or
+    # 500 bytes
+    rb'|<(?P<tag>[a-z][\w-]*)[^>]*\bclass="[^"]*(?:price|amount|_30jeq3|a-offscreen)[^"]*"[^>]*>'
+    rb'(?:[^<]|<(?!/(?P=tag)\s*>)){0,500}'
+    rb'|"(?:finalPrice|fsp|displayPrice|discounted|mrp)"\s*:\s*[\d.]+'
+    # Bare currency amounts anywhere in the text: the Flipkart text fallback
+    # reads these, and they catch prices nested deeper in a container
+    rb'|(?:\xe2\x82\xb9|&#8377;|&#x20b9;|\$|&#36;|\xe2\x82\xac|&euro;|\xc2\xa3|&pound;|\xc2\xa5|&yen;|\brs\.?)'
+    rb'\s*[\d,]+(?:\.\d+)?))',
+    re.IGNORECASE
+)
+
+def page_fingerprint(content):
+    """
+    Hashes the title/price/image regions of a raw page without parsing it,
+    plus Myntra's pdpData and the first usable <img> (read when the page
+    has no og:image). Pages with no price region hash whole.
+    """
+    digest = hashlib.sha256()
+    found = False
+    for match in FINGERPRINT_REGEX.finditer(content):
+        digest.update(match.group())
+        found = found or match.group('price') is not None
+    if b'__myx' in content:
+        details = myntra_pdp_details(scan_embedded_state(content))
+        digest.update(repr(details).encode())
+        found = found or details[1] is not None
+    for match in IMG_SRC_REGEX.finditer(content):
+        src = match.group(1).lower()
+        digest.update(match.group(1))
+        if b'logo' not in src and b'icon' not in src and b'sprite' not in src:
+            break
+    if not found:
+        digest.update(content)
+    return digest.hexdigest()
+
+def conditional_headers(validators):
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
 def get_headers(url=None):
     # More realistic headers to avoid bot detection
     headers = {
         'User-Agent': random.choice(USER_AGENTS),
         'Accept-Language': 'en-US,en;q=0.9',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        # gzip/deflate always; br/zstd when a decoder is installed
+        'Accept-Encoding': ACCEPT_ENCODING,
         'Referer': 'https://www.google.com/',
         'Upgrade-Insecure-Requests': '1',
         'Sec-Fetch-Dest': 'document',
@@ -77,280 +232,533 @@ def clean_price(price_str):
     except ValueError:
         return None, '$'
 
-def get_product_details(url):
-    session = requests.Session()
+@functools.lru_cache(maxsize=None)
+def get_parser_backend():
+    """
+    Returns the BeautifulSoup tree builder to use: SCRAPER_HTML_PARSER if set,
+    otherwise lxml when installed, falling back to the pure-Python html.parser.
+    """
+    configured = getattr(settings, 'SCRAPER_HTML_PARSER', None)
+    if configured:
+        return configured
     try:
-        # Use session for cookie handling
-        response = session.get(url, headers=get_headers(url), timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Check for CAPTCHA
-        if "Robot Check" in soup.title.string if soup.title else "" or "captcha" in response.url.lower():
-            return {'title': None, 'price': None, 'currency': '$', 'image_url': None, 'error': "Amazon CAPTCHA detected. Try again later."}
-
-        title = None
-        price = None
-        currency = '$'
-        image_url = None
-
-        # --- Amazon Specific Logic ---
-        # Check both input URL and final URL (in case of redirects/short links)
-        if 'amazon' in url or 'amzn' in url or 'amazon' in response.url:
-            # Title Strategies
-            title_selectors = [
-                'productTitle', 
-                'title', 
-                'ebooksProductTitle'
-            ]
-            for selector in title_selectors:
-                t = soup.find(id=selector)
-                if t:
-                    candidate_title = t.get_text().strip()
-                    if candidate_title and candidate_title not in BLACKLIST_TITLES:
-                        title = candidate_title
-                        break
-            
-            # Image Extraction Strategy
-            # 1. Check for data-a-dynamic-image in common IDs
-            img_candidates = ['landingImage', 'imgBlkFront', 'main-image', 'ebooksImgBlkFront']
-            for img_id in img_candidates:
-                img_tag = soup.find('img', id=img_id)
-                if img_tag:
-                    # Try to parse the dynamic image JSON
-                    dynamic_data = img_tag.get('data-a-dynamic-image')
-                    if dynamic_data:
-                        try:
-                            # It's a JSON string like {"url":[w,h], ...}
-                            # We want the largest one (or just the first one)
-                            images_dict = json.loads(dynamic_data)
-                            if images_dict:
-                                # Get the first URL (keys are URLs)
-                                image_url = list(images_dict.keys())[0]
-                                break
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    # Fallback to data-old-hires or src
-                    if not image_url:
-                        image_url = img_tag.get('data-old-hires') or img_tag.get('src')
-                    
-                    if image_url:
-                        break
-            
-            # 2. Try dynamic image wrapper if ID lookup failed
-            if not image_url:
-                dynamic_img = soup.find('div', id='imgTagWrapperId')
-                if dynamic_img:
-                    img_tag = dynamic_img.find('img')
-                    if img_tag:
-                         # Try dynamic data here too
-                        dynamic_data = img_tag.get('data-a-dynamic-image')
-                        if dynamic_data:
-                            try:
-                                images_dict = json.loads(dynamic_data)
-                                if images_dict:
-                                    image_url = list(images_dict.keys())[0]
-                            except:
-                                pass
-                        
-                        if not image_url:
-                            image_url = img_tag.get('src')
-            
-            # 3. Try finding the main image by class if IDs fail
-            if not image_url:
-                main_img_class = soup.find('img', class_='a-dynamic-image')
-                if main_img_class:
-                    image_url = main_img_class.get('src')
-
-        # --- Myntra Specific Logic ---
-        elif 'myntra.com' in url:
-            # Try to extract data from window.__myx
-            scripts = soup.find_all('script')
-            for s in scripts:
-                if s.string and 'window.__myx' in s.string:
-                    match = re.search(r'window\.__myx\s*=\s*({.*});?', s.string, re.DOTALL)
-                    if match:
-                        try:
-                            data = json.loads(match.group(1))
-                            if 'pdpData' in data:
-                                pdp = data['pdpData']
-                                title = pdp.get('name')
-                                price_data = pdp.get('price')
-                                if price_data:
-                                    price = price_data.get('discounted') or price_data.get('mrp')
-                                    currency = '₹' # Myntra is India-focused
-                                
-                                # Try to get image from media
-                                media = pdp.get('media', {})
-                                albums = media.get('albums', [])
-                                if albums and len(albums) > 0:
-                                    images = albums[0].get('images', [])
-                                    if images and len(images) > 0:
-                                        image_url = images[0].get('src')
-                                        if image_url:
-                                            image_url = image_url.replace('($height)', '720').replace('($width)', '540').replace('($qualityPercentage)', '90')
-                                
-                                if title and price:
-                                    break
-                        except:
-                            pass
-            
-            # Fallback for Myntra if JSON fails (will fall through to generic)
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
 
+def parse_html(content, parser=None, parse_only=None):
+    return BeautifulSoup(content, parser or get_parser_backend(), parse_only=parse_only)
 
-        # --- Generic Logic (Fallback) ---
-        
-        # Title Fallback
-        if not title or title in BLACKLIST_TITLES:
-            meta_title = soup.find('meta', property='og:title')
-            if meta_title:
-                title = meta_title['content']
-            
-            if not title or title in BLACKLIST_TITLES:
-                 if soup.title:
-                    title = soup.title.string.strip()
-            
-            if not title or title in BLACKLIST_TITLES:
-                h1 = soup.find('h1')
-                if h1:
-                    title = h1.get_text().strip()
-        
-        # Clean title if it still contains bad strings (sometimes "Amazon.in: ...")
-        if title:
-            for bad in BLACKLIST_TITLES:
-                if title == bad:
-                    title = None
-                    break
-
-        # Priority 1: Meta tags (most reliable)
-        price_meta_properties = [
-            'product:price:amount',
-            'og:price:amount',
-            'price',
-        ]
-        
-        for prop in price_meta_properties:
-            meta_price = soup.find('meta', property=prop) or soup.find('meta', attrs={'name': prop})
-            if meta_price:
-                cleaned, detected_currency = clean_price(meta_price.get('content'))
-                if cleaned:
-                    price = cleaned
-                    currency = detected_currency
-                    break
-        
-        # Priority 2: Common price classes/IDs if meta failed
-        if not price:
-            # Regex for currency symbols followed by digits
-            # Supports $, ₹, €, £
-            price_regex = re.compile(r'[₹$€£]\s*[\d,.]+')
-            
-            # Search in specific price classes first
-            price_classes = [
-                'a-price-whole', 'a-offscreen', # Amazon
-                'price', 'current-price', 'amount', # Generic
-                '_30jeq3', # Flipkart
-            ]
-            
-            for cls in price_classes:
-                element = soup.find(class_=cls)
-                if element:
-                    # For Amazon 'a-price-whole', it might be just "1,299" without symbol
-                    text = element.get_text().strip()
-                    # If it's just digits and separators, assume it's the price
-                    if re.match(r'^[\d,.]+$', text):
-                         cleaned, _ = clean_price(text) # Currency might be missing here, default to $ or previous detection
-                         if cleaned:
-                             price = cleaned
-                             # If we found a price but no currency yet, try to find a symbol nearby
-                             if 'amazon' in url: # Amazon usually implies local currency if not specified, or we can look for symbol
-                                 symbol_span = element.find_previous(class_='a-price-symbol')
-                                 if symbol_span:
-                                     currency = symbol_span.get_text().strip()
-                             elif 'flipkart' in url:
-                                 currency = '₹' # Flipkart is mostly India
-                             break
-                    
-                    match = price_regex.search(text)
-                    if match:
-                        cleaned, detected_currency = clean_price(match.group())
-                        if cleaned:
-                            price = cleaned
-                            currency = detected_currency
-                            break
-                if price: break
-
-            # Flipkart Mobile Fallback
-            if not price and 'flipkart.com' in url:
-                # Strategy 3: Regex for JSON fields (finalPrice, fsp)
-                # Found in window.__INITIAL_STATE__ or similar blobs
-                # e.g. "ppd":{"fsp":51999,"finalPrice":51999,...}
-                json_price_regexes = [
-                    re.compile(r'"finalPrice":\s*(\d+)'),
-                    re.compile(r'"fsp":\s*(\d+)'),
-                    re.compile(r'"displayPrice":\s*(\d+)'),
-                ]
-                
-                json_match_found = False
-                for regex in json_price_regexes:
-                    match = regex.search(str(soup))
-                    if match:
-                        val = float(match.group(1))
-                        json_match_found = True
-                        if val > 0:
-                            price = val
-                            currency = '₹'
-                            break
-                        # If val is 0, we found the key but it's 0. 
-                        # This likely means unavailable/sold out.
-                        # We mark json_match_found=True so we don't fall back to aggressive regex.
-
-                if not price and not json_match_found:
-                    # Search for price text directly ONLY if JSON method failed to find keys
-                    price_text_regex = re.compile(r'₹\d{1,3}(?:,\d{3})*(?:\.\d+)?')
-                    price_node = soup.find(string=price_text_regex)
-                    if price_node:
-                        cleaned, detected_currency = clean_price(price_node)
-                        if cleaned:
-                            price = cleaned
-                            currency = detected_currency
-
-        # Standard meta tag extraction (fallback for Amazon, primary for others)
-        if not image_url:
-            meta_image = soup.find('meta', property='og:image')
-            if meta_image:
-                image_url = meta_image.get('content')
-        
-        if not image_url:
-            # Fallback to first large image
-            images = soup.find_all('img')
-            for img in images:
-                src = img.get('src', '')
-                if src.startswith('http') and 'logo' not in src.lower() and 'icon' not in src.lower() and 'sprite' not in src.lower():
-                    image_url = src
-                    break
-
-        return {
-            'title': title,
-            'price': price,
-            'currency': '₹',
-            'image_url': image_url,
-            'error': None
+class ProductPageFilter(ElementFilter):
+    """
+    Lets BeautifulSoup build only the elements extract_product_details reads:
+    whole tags by name, and anything carrying one of the known ids or classes
+    (with all of its children). Everything else on the page is skipped while
+    parsing, which is most of a 1-2 MB marketplace page.
+    """
+
+    def __init__(self, tags, ids, classes):
+        super().__init__()
+        self.tags = frozenset(tags)
+        self.ids = frozenset(ids)
+        self.classes = frozenset(classes)
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        if name in self.tags:
+            return True
+        if not attrs:
+            return False
+        if attrs.get('id') in self.ids:
+            return True
+        classes = attrs.get('class')
+        if classes:
+            if isinstance(classes, str):
+                classes = classes.split()
+            return not self.classes.isdisjoint(classes)
+        return False
+
+    def allow_string_creation(self, string):
+        return False
+
+PRODUCT_PAGE_FILTER = ProductPageFilter(
+    tags=['title', 'meta', 'h1', 'img'],
+    ids=[
+        'productTitle', 'title', 'ebooksProductTitle',
+        'landingImage', 'imgBlkFront', 'main-image', 'ebooksImgBlkFront', 'imgTagWrapperId',
+    ],
+    classes=[
+        'a-price-whole', 'a-offscreen', 'a-price-symbol', 'a-dynamic-image',
+        'price', 'current-price', 'amount', '_30jeq3',
+    ],
+)
+
+# Amazon search pages: only the result cards are read
+AMAZON_RESULTS_STRAINER = SoupStrainer('div', attrs={'data-component-type': 's-search-result'})
+
+def unchanged_details(validators):
+    return {'title': None, 'price': None, 'currency': '$', 'image_url': None, 'error': None,
+            'unchanged': True, 'validators': validators}
+
+@timed_scraper
+def get_product_details(url, validators=None):
+    """
+    Scrapes title, price, currency and image from a product page.
+
+    When validators from the previous scrape are given, the page is fetched
+    conditionally and the result has 'unchanged': True (and nothing else
+    filled in) if the server answers 304 or the price/title regions hash the
+    same as last time.
+    """
+    try:
+        # Pooled per-marketplace session keeps connections and cookies warm
+        response = fetch(url, timeout=15, headers=conditional_headers(validators))
+        if response.status_code == 304 and validators:
+            return unchanged_details(validators)
+        response.raise_for_status()
+
+        new_validators = {
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+            'content_hash': page_fingerprint(response.content),
         }
+        if validators and validators.get('content_hash') == new_validators['content_hash']:
+            return unchanged_details(new_validators)
+
+        details = extract_product_details(response.content, url, response.url)
+        if not details['error']:
+            details['unchanged'] = False
+            details['validators'] = new_validators
+        return details
 
     except Exception as e:
+        return {'title': None, 'price': None, 'currency': '$', 'image_url': None, 'error': str(e)}
+
+# One pass over the raw page finds the JSON state Flipkart and Myntra embed
+# in inline scripts, e.g. window.__myx = {...} and "ppd":{"fsp":51999,...}
+EMBEDDED_STATE_REGEX = re.compile(
+    rb'window\.(__INITIAL_STATE__|__myx)\s*=\s*'
+    rb'|"(finalPrice|fsp|displayPrice)":\s*(\d+)'
+)
+# Checked in this order; the first key with a non-zero value wins
+EMBEDDED_PRICE_KEYS = ('finalPrice', 'fsp', 'displayPrice')
+
+# Price <meta> properties, in order of precedence
+META_PRICE_KEYS = ('product:price:amount', 'og:price:amount', 'price')
+
+HEAD_META_REGEX = re.compile(rb'<meta\s[^>]*>', re.IGNORECASE)
+HEAD_TITLE_REGEX = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+HTML_ATTR_REGEX = re.compile(rb'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+IMG_SRC_REGEX = re.compile(rb'<img\s[^>]*?\bsrc\s*=\s*["\'](http[^"\']*)["\']', re.IGNORECASE)
+
+def decode_json_at(content, start):
+    """Decodes the JSON value starting at content[start:], bounded by its </script>."""
+    end = content.find(b'</script>', start)
+    text = content[start:end if end != -1 else len(content)].decode('utf-8', 'replace')
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+    except ValueError:
         return None
+    return value if isinstance(value, dict) else None
+
+def find_embedded_json(content, marker):
+    """Returns the JSON object assigned to `marker = {...}` in the raw page, if any."""
+    match = re.search(re.escape(marker) + rb'\s*=\s*', content)
+    if match:
+        return decode_json_at(content, match.end())
+    return None
+
+def scan_embedded_state(content):
+    """
+    Scans raw page bytes once for embedded JSON state. Returns a dict with
+    'myx' (Myntra's decoded window.__myx, or None) and 'prices' (the first
+    finalPrice/fsp/displayPrice value seen for each key).
+    """
+    state = {'myx': None, 'prices': {}}
+    for match in EMBEDDED_STATE_REGEX.finditer(content):
+        if match.group(1) == b'__myx':
+            if state['myx'] is None:
+                state['myx'] = decode_json_at(content, match.end())
+        elif match.group(2):
+            state['prices'].setdefault(match.group(2).decode(), float(match.group(3)))
+    return state
+
+def embedded_price(state):
+    """Returns (price, key_found) from scanned Flipkart state."""
+    key_found = False
+    for key in EMBEDDED_PRICE_KEYS:
+        if key in state['prices']:
+            key_found = True
+            if state['prices'][key] > 0:
+                return state['prices'][key], True
+    return None, key_found
+
+def myntra_pdp_details(state):
+    """Returns (title, price, image_url) from Myntra's window.__myx pdpData."""
+    data = state['myx'] or {}
+    pdp = data.get('pdpData')
+    if not isinstance(pdp, dict):
+        return None, None, None
+
+    title = pdp.get('name')
+    price = None
+    price_data = pdp.get('price')
+    if price_data:
+        price = price_data.get('discounted') or price_data.get('mrp')
+
+    image_url = None
+    albums = (pdp.get('media') or {}).get('albums', [])
+    if albums:
+        images = albums[0].get('images', [])
+        if images:
+            image_url = images[0].get('src')
+            if image_url:
+                image_url = image_url.replace('($height)', '720').replace('($width)', '540').replace('($qualityPercentage)', '90')
+    return title, price, image_url
+
+def raw_head_details(content):
+    """Reads og:title/og:image and <title> from the raw <head> without building a DOM."""
+    head_end = content.find(b'</head>')
+    head = content[:head_end] if head_end != -1 else content
+    meta = {}
+    for tag in HEAD_META_REGEX.finditer(head):
+        attrs = {}
+        for name, double, single in HTML_ATTR_REGEX.findall(tag.group()):
+            attrs[name.lower()] = double or single
+        key = attrs.get(b'property') or attrs.get(b'name')
+        if key and b'content' in attrs:
+            meta.setdefault(key.decode('utf-8', 'replace'), html.unescape(attrs[b'content'].decode('utf-8', 'replace')))
+
+    page_title = None
+    match = HEAD_TITLE_REGEX.search(head)
+    if match:
+        page_title = html.unescape(match.group(1).decode('utf-8', 'replace')).strip()
+    return meta, page_title
+
+def embedded_state_details(content, url, state):
+    """
+    Builds the product details straight from embedded JSON state, or returns
+    None when the page has to go through the DOM extractor instead.
+    """
+    title = image_url = None
+    if 'myntra.com' in url:
+        title, price, image_url = myntra_pdp_details(state)
+    else:
+        price, _ = embedded_price(state)
+    if not price:
+        return None
+
+    # Meta prices outrank the embedded one, as in the site extractors
+    meta, page_title = raw_head_details(content)
+    for key in META_PRICE_KEYS:
+        meta_price, _ = clean_price(meta.get(key))
+        if meta_price:
+            price = meta_price
+            break
+
+    for candidate in (title, meta.get('og:title'), page_title):
+        if candidate and candidate not in BLACKLIST_TITLES:
+            title = candidate
+            break
+    else:
+        return None
+
+    if not image_url:
+        image_url = meta.get('og:image')
+    if not image_url:
+        for match in IMG_SRC_REGEX.finditer(content):
+            src = match.group(1).decode('utf-8', 'replace')
+            if 'logo' not in src.lower() and 'icon' not in src.lower() and 'sprite' not in src.lower():
+                image_url = src
+                break
+
+    return {
+        'title': title,
+        'price': price,
+        'currency': '₹',
+        'image_url': image_url,
+        'error': None
+    }
+
+class ProductPage:
+    """A product page as seen by the extractor strategies."""
+
+    def __init__(self, content, url, final_url, soup, parser=None, restricted=True, state=None):
+        self.content = content
+        self.url = url
+        self.final_url = final_url
+        self.soup = soup
+        self.parser = parser
+        self.restricted = restricted
+        self._state = state
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = scan_embedded_state(self.content)
+        return self._state
+
+    @functools.cached_property
+    def full_soup(self):
+        # The restricted parse drops free text; text searches need the whole page
+        return parse_html(self.content, self.parser) if self.restricted else self.soup
+
+def usable_title(title):
+    if title and title not in BLACKLIST_TITLES:
+        return title
+    return None
+
+def first_dynamic_image(img_tag):
+    """First URL from Amazon's data-a-dynamic-image JSON ({"url":[w,h], ...})."""
+    dynamic_data = img_tag.get('data-a-dynamic-image')
+    if dynamic_data:
+        try:
+            images_dict = json.loads(dynamic_data)
+            if images_dict:
+                return list(images_dict.keys())[0]
+        except (ValueError, AttributeError):
+            pass
+    return None
+
+# --- Title strategies ---
+
+def title_by_id(element_id):
+    def strategy(page):
+        t = page.soup.find(id=element_id)
+        if t:
+            return usable_title(t.get_text().strip())
+    return strategy
+
+def myntra_title(page):
+    return usable_title(myntra_pdp_details(page.state)[0])
+
+def og_title(page):
+    meta_title = page.soup.find('meta', property='og:title')
+    if meta_title:
+        return usable_title(meta_title.get('content'))
+
+def document_title(page):
+    if page.soup.title and page.soup.title.string:
+        return usable_title(page.soup.title.string.strip())
+
+def first_h1(page):
+    h1 = page.soup.find('h1')
+    if h1:
+        return usable_title(h1.get_text().strip())
+
+# --- Price strategies (return (price, currency)) ---
+
+def meta_price(prop):
+    def strategy(page):
+        meta_price = page.soup.find('meta', property=prop) or page.soup.find('meta', attrs={'name': prop})
+        if meta_price:
+            cleaned, detected_currency = clean_price(meta_price.get('content'))
+            if cleaned:
+                return cleaned, detected_currency
+    return strategy
+
+def myntra_price(page):
+    price = myntra_pdp_details(page.state)[1]
+    if price:
+        return price, '₹' # Myntra is India-focused
+
+# Regex for currency symbols followed by digits
+# Supports $, ₹, €, £
+PRICE_REGEX = re.compile(r'[₹$€£]\s*[\d,.]+')
+
+def class_price(cls):
+    def strategy(page):
+        element = page.soup.find(class_=cls)
+        if not element:
+            return None
+        # For Amazon 'a-price-whole', it might be just "1,299" without symbol
+        text = element.get_text().strip()
+        # If it's just digits and separators, assume it's the price
+        if re.match(r'^[\d,.]+$', text):
+            cleaned, currency = clean_price(text)
+            if cleaned:
+                # If we found a price but no currency yet, try to find a symbol nearby
+                if 'amazon' in page.url:
+                    symbol_span = element.find_previous(class_='a-price-symbol')
+                    if symbol_span:
+                        currency = symbol_span.get_text().strip()
+                elif 'flipkart' in page.url:
+                    currency = '₹' # Flipkart is mostly India
+                return cleaned, currency
+
+        match = PRICE_REGEX.search(text)
+        if match:
+            cleaned, detected_currency = clean_price(match.group())
+            if cleaned:
+                return cleaned, detected_currency
+    return strategy
+
+def flipkart_json_price(page):
+    # JSON fields (finalPrice, fsp) from window.__INITIAL_STATE__, scanned
+    # out of the raw page, e.g. "ppd":{"fsp":51999,"finalPrice":51999,...}
+    price, _ = embedded_price(page.state)
+    if price:
+        return price, '₹'
+
+def flipkart_text_price(page):
+    # Search for price text directly ONLY if the JSON keys are missing. A key
+    # that is present but 0 likely means unavailable/sold out.
+    if embedded_price(page.state)[1]:
+        return None
+    price_node = page.full_soup.find(string=re.compile(r'₹\d{1,3}(?:,\d{3})*(?:\.\d+)?'))
+    if price_node:
+        cleaned, detected_currency = clean_price(price_node)
+        if cleaned:
+            return cleaned, detected_currency
+
+# --- Image strategies ---
+
+def image_by_id(img_id):
+    def strategy(page):
+        img_tag = page.soup.find('img', id=img_id)
+        if img_tag:
+            # Dynamic image JSON, then data-old-hires or src
+            return first_dynamic_image(img_tag) or img_tag.get('data-old-hires') or img_tag.get('src')
+    return strategy
+
+def amazon_wrapper_image(page):
+    dynamic_img = page.soup.find('div', id='imgTagWrapperId')
+    if dynamic_img:
+        img_tag = dynamic_img.find('img')
+        if img_tag:
+            return first_dynamic_image(img_tag) or img_tag.get('src')
+
+def amazon_dynamic_class_image(page):
+    main_img_class = page.soup.find('img', class_='a-dynamic-image')
+    if main_img_class:
+        return main_img_class.get('src')
+
+def myntra_image(page):
+    return myntra_pdp_details(page.state)[2]
+
+def og_image(page):
+    meta_image = page.soup.find('meta', property='og:image')
+    if meta_image:
+        return meta_image.get('content')
+
+def first_large_image(page):
+    for img in page.soup.find_all('img'):
+        src = img.get('src', '')
+        if src.startswith('http') and 'logo' not in src.lower() and 'icon' not in src.lower() and 'sprite' not in src.lower():
+            return src
+
+# --- Site extractors ---
+
+def generic_title_strategies():
+    return [
+        Strategy('og:title', og_title),
+        Strategy('<title>', document_title),
+        Strategy('<h1>', first_h1),
+    ]
+
+def generic_price_strategies():
+    # Meta tags (most reliable), then common price classes/IDs
+    return (
+        [Strategy(f'meta:{prop}', meta_price(prop), group='meta-price') for prop in META_PRICE_KEYS]
+        + [Strategy(f'class:{cls}', class_price(cls)) for cls in (
+            'a-price-whole', 'a-offscreen', # Amazon
+            'price', 'current-price', 'amount', # Generic
+            '_30jeq3', # Flipkart
+        )]
+    )
+
+def generic_image_strategies():
+    return [
+        Strategy('og:image', og_image),
+        Strategy('first-large-img', first_large_image),
+    ]
+
+def build_extractors():
+    amazon = SiteExtractor(
+        'amazon.in',
+        title=[Strategy(f'#{i}', title_by_id(i), group='title-id') for i in ('productTitle', 'title', 'ebooksProductTitle')]
+        + generic_title_strategies(),
+        price=generic_price_strategies(),
+        image=[Strategy(f'img#{i}', image_by_id(i), group='image-id') for i in ('landingImage', 'imgBlkFront', 'main-image', 'ebooksImgBlkFront')]
+        + [Strategy('#imgTagWrapperId', amazon_wrapper_image), Strategy('img.a-dynamic-image', amazon_dynamic_class_image)]
+        + generic_image_strategies(),
+    )
+    generic_prices = generic_price_strategies()
+    myntra = SiteExtractor(
+        'myntra.com',
+        title=[Strategy('__myx', myntra_title)] + generic_title_strategies(),
+        # Meta prices outrank the embedded pdpData price
+        price=generic_prices[:3] + [Strategy('__myx', myntra_price)] + generic_prices[3:],
+        image=[Strategy('__myx', myntra_image)] + generic_image_strategies(),
+    )
+    flipkart = SiteExtractor(
+        'flipkart.com',
+        title=generic_title_strategies(),
+        price=generic_price_strategies() + [
+            Strategy('__INITIAL_STATE__', flipkart_json_price),
+            Strategy('text:₹', flipkart_text_price),
+        ],
+        image=generic_image_strategies(),
+    )
+    generic = SiteExtractor(
+        'generic',
+        title=generic_title_strategies(),
+        price=generic_price_strategies(),
+        image=generic_image_strategies(),
+    )
+
+    registry = ExtractorRegistry(get_marketplace, default=generic)
+    # Any Amazon storefront or short link, even behind a redirect
+    registry.register('amazon.in', amazon, matches=lambda url: 'amazon' in url or 'amzn' in url)
+    registry.register('myntra.com', myntra)
+    registry.register('flipkart.com', flipkart)
+    return registry
+
+extractors = build_extractors()
+
+def extract_product_details(content, url, final_url=None, parser=None, restricted=True):
+    """
+    Extracts title, price, currency and image from a product page's raw HTML.
+
+    With restricted=True only the elements the extractors read are built
+    (see PRODUCT_PAGE_FILTER); restricted=False parses the whole document.
+    """
+    final_url = final_url or url
+
+    # Flipkart/Myntra embed the price in JSON state; when it is there the
+    # DOM is never built
+    state = None
+    if 'flipkart.com' in url or 'myntra.com' in url:
+        state = scan_embedded_state(content)
+        details = embedded_state_details(content, url, state)
+        if details:
+            return details
+
+    soup = parse_html(content, parser, PRODUCT_PAGE_FILTER if restricted else None)
+
+    # Check for CAPTCHA
+    if "Robot Check" in soup.title.string if soup.title else "" or "captcha" in final_url.lower():
+        return {'title': None, 'price': None, 'currency': '$', 'image_url': None, 'error': "Amazon CAPTCHA detected. Try again later."}
+
+    page = ProductPage(content, url, final_url, soup, parser=parser, restricted=restricted, state=state)
+    extracted = extractors.get(url, final_url).extract(page)
+    return {
+        'title': extracted['title'],
+        'price': extracted['price'][0] if extracted['price'] else None,
+        'currency': '₹',
+        'image_url': extracted['image'],
+        'error': None
+    }
 
 def search_amazon(query):
     """Searches Amazon for a product."""
     encoded_query = urllib.parse.quote(query)
     url = f"https://www.amazon.in/s?k={encoded_query}"
-    headers = get_headers(url)
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = fetch(url, timeout=10)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = parse_html(response.content, parse_only=AMAZON_RESULTS_STRAINER)
             results = []
             
             # Amazon search results
@@ -399,27 +807,14 @@ def search_flipkart(query):
     """Searches Flipkart for a product (Mobile View) using JSON state."""
     encoded_query = urllib.parse.quote(query)
     url = f"https://www.flipkart.com/search?q={encoded_query}"
-    headers = get_headers(url)
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = fetch(url, timeout=10)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
             results = []
             
-            # Strategy 1: Parse window.__INITIAL_STATE__ JSON
-            scripts = soup.find_all('script')
-            json_data = None
-            
-            for script in scripts:
-                if script.string and 'window.__INITIAL_STATE__' in script.string:
-                    match = re.search(r'window\.__INITIAL_STATE__\s*=\s*({.*});', script.string)
-                    if match:
-                        try:
-                            json_data = json.loads(match.group(1))
-                            break
-                        except:
-                            pass
+            # Strategy 1: Parse window.__INITIAL_STATE__ JSON straight from the raw page
+            json_data = find_embedded_json(response.content, b'window.__INITIAL_STATE__')
             
             if json_data:
                 try:
@@ -489,6 +884,7 @@ def search_flipkart(query):
                 # Regex to match at least one word
                 pattern = re.compile(r"|".join([re.escape(w) for w in query_words]), re.IGNORECASE)
                 
+                soup = parse_html(response.content)
                 body = soup.find('body')
                 if body:
                     matches = body.find_all(string=pattern)
@@ -554,17 +950,31 @@ def search_flipkart(query):
         print(f"Flipkart search error: {e}")
     return []
 
-def search_products(query):
-    """Aggregates search results from all marketplaces."""
-    results = []
-    
-    # Search all marketplaces
-    results.extend(search_amazon(query))
-    results.extend(search_flipkart(query))
-    
+# Marketplace searches run concurrently, so adding a source here adds no latency
+SEARCH_SOURCES = [
+    ('Amazon', search_amazon),
+    ('Flipkart', search_flipkart),
     # TODO: Add Myntra search when implemented
-    # results.extend(search_myntra(query))
-    
+    # ('Myntra', search_myntra),
+]
+
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+def get_search_executor():
+    """Shared pool for marketplace searches; slow searches finish here after the caller has moved on."""
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SCRAPER_SEARCH_WORKERS', 16),
+                    thread_name_prefix='search',
+                )
+    return _search_executor
+
+def match_results(query, results):
+    """Keeps results whose titles match the query and sorts them by price."""
     # Filter to only exact matches (50% word overlap)
     def is_exact_match(item):
         title_lower = item['title'].lower()
@@ -588,3 +998,44 @@ def search_products(query):
     
     return exact_matches
 
+@timed_scraper
+def search_marketplaces(query, deadline=None):
+    """
+    Searches all marketplaces concurrently under one overall deadline (in
+    seconds, SCRAPER_SEARCH_DEADLINE by default).
+
+    Returns {'results': [...], 'partial': bool, 'missing': [source names]}
+    where 'missing' lists the sources that had not answered by the deadline.
+    """
+    if deadline is None:
+        deadline = getattr(settings, 'SCRAPER_SEARCH_DEADLINE', 8)
+    executor = get_search_executor()
+    futures = {executor.submit(search, query): name for name, search in SEARCH_SOURCES}
+
+    results = []
+    finished = set()
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            finished.add(future)
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"{futures[future]} search error: {e}")
+    except FuturesTimeoutError:
+        pass
+
+    missing = []
+    for future, name in futures.items():
+        if future not in finished:
+            future.cancel()
+            missing.append(name)
+
+    return {
+        'results': match_results(query, results),
+        'partial': bool(missing),
+        'missing': missing,
+    }
+
+def search_products(query):
+    """Aggregates search results from all marketplaces."""
+    return search_marketplaces(query)['results']
@@ -0,0 +1,70 @@
+import re
+
+from django.db import connections
+
+# Full-text index over Product.name. On SQLite this is an external-content
+# FTS5 table kept in sync by triggers; on PostgreSQL a GIN index over
+# to_tsvector(SEARCH_CONFIG, name). Both are created by migration 0014;
+# 0017 restores the SQLite triggers after 0015 rebuilt tracker_product.
+FTS_TABLE = 'tracker_product_fts'
+SEARCH_CONFIG = 'simple'
+
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+_fts_tables = {}
+
+
+def query_tokens(query):
+    return TOKEN_REGEX.findall(query.lower())
+
+
+def has_fts_table(alias):
+    """Whether the FTS5 table exists on this SQLite database (SQLite builds may lack FTS5)."""
+    if alias not in _fts_tables:
+        _fts_tables[alias] = FTS_TABLE in connections[alias].introspection.table_names()
+    return _fts_tables[alias]
+
+
+def find_products(queryset, query):
+    """
+    Products in queryset whose names match every word of query, treating
+    each word as a prefix so live search matches while typing, ordered by
+    relevance. Uses the full-text index where there is one and falls back
+    to name__icontains otherwise.
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return queryset.filter(name__icontains=query.strip()).order_by('-created_at')
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite' and has_fts_table(queryset.db):
+        return _find_sqlite(queryset, tokens)
+    if vendor == 'postgresql':
+        return _find_postgresql(queryset, tokens)
+    return queryset.filter(name__icontains=query.strip()).order_by('-created_at')
+
+
+def _find_sqlite(queryset, tokens):
+    # Quoted prefix terms, implicitly ANDed: "iph"* "15"*
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    table = queryset.model._meta.db_table
+    # Joined rather than correlated, so MATCH runs once and yields each
+    # match's rank (bm25(), lower is better) in the same pass; the
+    # queryset's own filters then apply to the joined product rows
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = "{table}"."id"'],
+        params=[match],
+        select={'rank': f'{FTS_TABLE}.rank'},
+    ).order_by('rank', '-created_at')
+
+
+def _find_postgresql(queryset, tokens):
+    # Imported here: the module requires psycopg, which SQLite installs lack
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    vector = SearchVector('name', config=SEARCH_CONFIG)
+    search_query = SearchQuery(' & '.join(f"{token}:*" for token in tokens), config=SEARCH_CONFIG, search_type='raw')
+    return queryset.annotate(search=vector).filter(search=search_query).annotate(
+        rank=SearchRank(vector, search_query),
+    ).order_by('-rank', '-created_at')
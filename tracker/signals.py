@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_deal_summaries
+from .models import Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_owner_summary(sender, instance, **kwargs):
+    """
+    Drops the owner's cached deal summary once the write commits. Bulk
+    operations send no signals; their callers invalidate explicitly.
+    """
+    if instance.user_id is not None:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: invalidate_deal_summaries([user_id]))
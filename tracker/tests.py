@@ -1,3 +1,902 @@
-from django.test import TestCase
+import json
+import re
+import tempfile
+from io import StringIO
+from pathlib import Path
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Min
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import (
+    SEARCH_CACHE_ALIAS, SUMMARY_CACHE_ALIAS, cached_search_marketplaces, get_deal_summary, search_stats,
+    summary_cache_key,
+)
+from .corpus import FixtureAdapter, load_manifest, page_key, read_page
+from .extractors import Strategy, StrategyList
+from .history import (
+    MODE_ALL, MODE_CHANGES, RESOLUTION_RAW, archive_history_batch, archived_history, history_observations,
+    record_prices, unpack_history, update_rollups,
+)
+from .imports import ImportFormatError, create_import, import_status, parse_import
+from .jobs import (
+    claim_next_job, claim_pending_products, enqueue_refresh, fetch_pending_products, reset_interrupted_fetches, run_job,
+    run_worker,
+)
+from .metrics import registry
+from .models import ImportRow, PriceHistory, PriceRollup, Product, RefreshJob
+from .refresh import RefreshWriter, UNCHANGED, UPDATED, refresh_products
+from .scraper import (
+    build_extractors, clean_price, extract_product_details, get_product_details, page_fingerprint,
+    search_amazon, search_flipkart, search_products, sessions,
+)
+from .search import find_products
+
+
+class CleanPriceTests(SimpleTestCase):
+    def test_formats(self):
+        self.assertEqual(clean_price('₹69,900.00'), (69900.0, '₹'))
+        self.assertEqual(clean_price('₹ 1,499'), (1499.0, '₹'))
+        self.assertEqual(clean_price('$19.99'), (19.99, '$'))
+        self.assertEqual(clean_price('€ 1.299,00'), (1299.0, '€'))
+
+    def test_empty(self):
+        self.assertEqual(clean_price(None), (None, '$'))
+        self.assertEqual(clean_price(''), (None, '$'))
+        self.assertEqual(clean_price('N/A'), (None, '$'))
+
+
+class StrategyListTests(SimpleTestCase):
+    def run_pages(self, strategies, pages):
+        strategy_list = StrategyList(strategies, min_samples=4, reorder_every=4)
+        for page in pages:
+            strategy_list.run(page)
+        return strategy_list.order
+
+    def test_groups_reorder_by_wins(self):
+        strategies = [
+            Strategy('#a', lambda page: page.get('a'), group='id'),
+            Strategy('#b', lambda page: page.get('b'), group='id'),
+            Strategy('fallback', lambda page: 'x'),
+        ]
+        self.assertEqual(self.run_pages(strategies, [{'b': 1}] * 3 + [{'a': 1}]), ['#b', '#a', 'fallback'])
+
+    def test_declared_precedence_across_groups(self):
+        strategies = [
+            Strategy('site', lambda page: page.get('site')),
+            Strategy('generic', lambda page: 'x'),
+        ]
+        # generic wins its only attempt (rate 1.0) against site's 3/4
+        self.assertEqual(self.run_pages(strategies, [{}] + [{'site': 1}] * 3), ['site', 'generic'])
+
+
+class CorpusScraperTests(SimpleTestCase):
+    """Runs the scraper against the saved pages in tracker/testdata/pages."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.manifest = load_manifest()
+
+    def assertExpected(self, details, entry):
+        expected = entry['expected']
+        self.assertIsNone(details['error'])
+        self.assertEqual(details['title'], expected['title'])
+        self.assertEqual(details['price'], expected['price'])
+        self.assertEqual(details['image_url'], expected['image_url'])
+        self.assertEqual(details['currency'], '₹')
+
+    def test_extract_product_details(self):
+        for entry in self.manifest['product']:
+            with self.subTest(page=entry['file']):
+                self.assertExpected(extract_product_details(read_page(entry), entry['url']), entry)
+
+    def test_restricted_parse_matches_full_parse(self):
+        for entry in self.manifest['product']:
+            with self.subTest(page=entry['file']):
+                content = read_page(entry)
+                self.assertEqual(
+                    extract_product_details(content, entry['url']),
+                    extract_product_details(content, entry['url'], parser='html.parser', restricted=False),
+                )
+
+    def test_get_product_details(self):
+        adapter = FixtureAdapter(self.manifest)
+        with sessions.using_adapter(adapter):
+            for entry in self.manifest['product']:
+                with self.subTest(page=entry['file']):
+                    self.assertExpected(get_product_details(entry['url']), entry)
+        self.assertEqual(adapter.requests, len(self.manifest['product']))
+
+    def test_fingerprint_changes_with_price(self):
+        for entry in self.manifest['product']:
+            with self.subTest(page=entry['file']):
+                content = read_page(entry)
+                price = entry['expected']['price']
+                changed = content
+                for text in {f"{price:,.0f}", f"{price:.0f}"}:
+                    replacement = b'12,345' if ',' in text else b'12345'
+                    changed = re.sub(rb'(?<![\d.])(?<!\d,)' + re.escape(text.encode()) + rb'(?![\d.]|,\d)', replacement, changed)
+                self.assertEqual(extract_product_details(changed, entry['url'])['price'], 12345)
+                self.assertNotEqual(page_fingerprint(content), page_fingerprint(changed))
+
+    def test_text_price_change_is_not_unchanged(self):
+        # Price only in plain ₹ text under an unrecognised class (flipkart_text_price)
+        entry = next(e for e in self.manifest['product'] if e['file'] == 'flipkart_product_legacy.html')
+        content = read_page(entry).replace(b'_30jeq3 _16Jk6d', b'Nx9bqj CxhGGd')
+        adapter = FixtureAdapter(self.manifest)
+        adapter.pages[page_key(entry['url'])] = content
+        with sessions.using_adapter(adapter):
+            first = get_product_details(entry['url'])
+            self.assertEqual(first['price'], 1499)
+            self.assertTrue(get_product_details(entry['url'], first['validators'])['unchanged'])
+            adapter.pages[page_key(entry['url'])] = content.replace('₹1,499'.encode(), '₹1,299'.encode())
+            second = get_product_details(entry['url'], first['validators'])
+        self.assertFalse(second['unchanged'])
+        self.assertEqual(second['price'], 1299)
+
+    def test_nested_price_change_is_not_unchanged(self):
+        # Price text nested inside the price container, in other currencies
+        url = 'https://shop.example.com/desk-lamp'
+        page = '<html><head><title>Desk Lamp</title></head><body><h1>Desk Lamp</h1>{}</body></html>'
+        cases = [
+            ('<div class="price"><span>$19.99</span></div>', '$19.99', '$24.99', 24.99),
+            ('<div class="price"><div class="label">Price</div><div><b>€ 1.299,00</b></div></div>', '€ 1.299,00', '€ 1.199,00', 1199),
+        ]
+        for container, old, new, price in cases:
+            with self.subTest(container=container):
+                adapter = FixtureAdapter(self.manifest)
+                adapter.pages[page_key(url)] = page.format(container).encode()
+                with sessions.using_adapter(adapter):
+                    first = get_product_details(url)
+                    self.assertTrue(get_product_details(url, first['validators'])['unchanged'])
+                    adapter.pages[page_key(url)] = page.format(container.replace(old, new)).encode()
+                    second = get_product_details(url, first['validators'])
+                self.assertFalse(second['unchanged'])
+                self.assertEqual(second['price'], price)
+
+    def test_meta_price_outranks_embedded_state(self):
+        for entry in self.manifest['product']:
+            if 'amazon' in entry['url']:
+                continue
+            with self.subTest(page=entry['file']):
+                content = read_page(entry).replace(
+                    b'</head>', b'<meta property="product:price:amount" content="299"></head>', 1)
+                details = extract_product_details(content, entry['url'])
+                self.assertEqual(details['price'], 299)
+                self.assertEqual(details, extract_product_details(content, entry['url'], parser='html.parser', restricted=False))
+
+    def test_fallback_page_keeps_strategy_precedence(self):
+        # One Amazon page without #productTitle/#title, then normal pages:
+        # <title> must not overtake the site selectors
+        entry = next(e for e in self.manifest['product'] if e['file'] == 'amazon_product.html')
+        content = read_page(entry)
+        fallback_page = content.replace(b'id="productTitle"', b'id="productName"').replace(b'id="title"', b'id="heading"')
+        with mock.patch('tracker.scraper.extractors', build_extractors()) as registry:
+            self.assertNotEqual(extract_product_details(fallback_page, entry['url'])['title'], entry['expected']['title'])
+            for _ in range(39):
+                self.assertExpected(extract_product_details(content, entry['url']), entry)
+            order = registry.get(entry['url']).fields['title'].order
+        self.assertEqual(order[:3], ['#productTitle', '#title', '#ebooksProductTitle'])
+        self.assertLess(order.index('#ebooksProductTitle'), order.index('<title>'))
+
+    def test_get_product_details_http_error(self):
+        with sessions.using_adapter(FixtureAdapter(self.manifest)):
+            details = get_product_details('https://www.amazon.in/missing/dp/B000000000')
+        self.assertIsNone(details['price'])
+        self.assertIn('404', details['error'])
+
+    def test_search_pages(self):
+        sources = {'Amazon': search_amazon, 'Flipkart': search_flipkart}
+        with sessions.using_adapter(FixtureAdapter(self.manifest)):
+            for entry in self.manifest['search']:
+                with self.subTest(page=entry['file']):
+                    results = sources[entry['source']](entry['query'])
+                    self.assertEqual(len(results), entry['expected_count'])
+                    for item in results:
+                        self.assertEqual(item['source'], entry['source'])
+                        self.assertTrue(item['title'])
+                        self.assertGreater(item['price'], 0)
+
+    def test_search_products_sorted_by_price(self):
+        query = self.manifest['search'][0]['query']
+        with sessions.using_adapter(FixtureAdapter(self.manifest)):
+            results = search_products(query)
+        self.assertEqual(len(results), sum(entry['expected_count'] for entry in self.manifest['search']))
+        prices = [item['price'] for item in results]
+        self.assertEqual(prices, sorted(prices))
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot Product/PriceHistory queries must be served by their composite
+    indexes rather than a table scan. Runs on SQLite, and on PostgreSQL with
+    sequential scans disabled so the small test tables don't favour them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        cls.product = Product.objects.create(
+            user=cls.user, name='Phone', url='https://www.amazon.in/dp/B0', target_price=100, current_price=120,
+        )
+        PriceHistory.objects.create(product=cls.product, price=120)
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f"No query plan assertions for {connection.vendor}")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.explain(queryset)
+        self.assertIn(index, plan)
+        # Ordering comes from the index, not a separate sort step
+        self.assertNotRegex(plan, r'TEMP B-TREE|\bSort\b')
+
+    def test_user_products_newest_first(self):
+        self.assertUsesIndex(
+            Product.objects.filter(user=self.user).order_by('-created_at'), 'tracker_product_user_created',
+        )
+
+    def test_active_products_stalest_first(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True).order_by('last_checked'), 'tracker_product_active_checked',
+        )
+
+    def test_price_history_in_time_order(self):
+        self.assertUsesIndex(self.product.price_history.order_by('timestamp'), 'tracker_pricehistory_prod_ts')
+
+    def test_lowest_price_does_not_scan(self):
+        plan = self.explain(PriceHistory.objects.filter(product=self.product).values('product').annotate(Min('price')))
+        self.assertNotRegex(plan, r'SCAN tracker_pricehistory(?! USING)|Seq Scan')
+
+
+class DealStatsTests(TestCase):
+    def test_deal_stats(self):
+        user = User.objects.create_user('deals')
+        Product.objects.create(user=user, name='Deal', url='https://www.amazon.in/dp/D', target_price=50, current_price=40)
+        Product.objects.create(user=user, name='Over', url='https://www.amazon.in/dp/O', target_price=50, current_price=60)
+        Product.objects.create(user=user, name='New', url='https://www.amazon.in/dp/N', target_price=50)
+        Product.objects.create(user=user, name='Free', url='https://www.amazon.in/dp/F', target_price=50, current_price=0)
+        stats = Product.objects.filter(user=user).deal_stats()
+        self.assertEqual(stats, {'total': 4, 'deals': 2, 'savings': Decimal('10.00')})
+        self.assertEqual(Product.objects.none().deal_stats(), {'total': 0, 'deals': 0, 'savings': 0})
+
+
+class RefreshWriterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('writer', 'writer@example.com')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            user=self.user, name='Phone', url='https://www.amazon.in/dp/B1', target_price=100,
+        )
+
+    def details(self, price, unchanged=False):
+        return {
+            'title': 'Phone', 'price': price, 'currency': '₹', 'image_url': None, 'error': None,
+            'unchanged': unchanged, 'validators': {'etag': 'v1', 'last_modified': '', 'content_hash': 'h'},
+        }
+
+    def refresh(self, details):
+        product = Product.objects.get(pk=self.product.pk)
+        with RefreshWriter() as writer:
+            outcome = writer.add(product, details)
+        return outcome
+
+    def test_unchanged_page_counts_as_observation(self):
+        self.assertEqual(self.refresh(self.details(120)), UPDATED)
+        first = PriceHistory.objects.get(product=self.product)
+        self.assertEqual(self.refresh(self.details(None, unchanged=True)), UNCHANGED)
+
+        row = PriceHistory.objects.get(product=self.product)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(row.observations, 2)
+        self.assertGreater(row.last_seen, first.last_seen)
+        self.assertEqual(product.last_checked, row.last_seen)
+        rollup = PriceRollup.objects.get(product=self.product, resolution=PriceRollup.RESOLUTION_HOUR)
+        self.assertEqual((rollup.count, rollup.price_sum), (2, Decimal('240.00')))
+        self.assertEqual(product.avg_price_30d, Decimal('120.00'))
+        self.assertEqual(product.price_change_count, 0)
+
+    def test_price_drop_emails_once(self):
+        self.refresh(self.details(90))
+        self.refresh(self.details(None, unchanged=True))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Price Drop Alert', mail.outbox[0].subject)
+
+
+class DealSummaryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('summary')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            user=self.user, name='Phone', url='https://www.amazon.in/dp/B1', target_price=100, current_price=120,
+        )
+
+    def cached(self):
+        return caches[SUMMARY_CACHE_ALIAS].get(summary_cache_key(self.user.pk))
+
+    def test_summary_is_cached(self):
+        self.assertEqual(get_deal_summary(self.user), {'total': 1, 'deals': 0, 'savings': 0})
+        self.assertEqual(self.cached(), {'total': 1, 'deals': 0, 'savings': 0})
+
+    def test_product_save_and_delete_invalidate(self):
+        get_deal_summary(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.current_price = 90
+            self.product.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(get_deal_summary(self.user), {'total': 1, 'deals': 1, 'savings': Decimal('10.00')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertIsNone(self.cached())
+        self.assertEqual(get_deal_summary(self.user)['total'], 0)
+
+    def test_refresh_writer_invalidates(self):
+        get_deal_summary(self.user)
+        with RefreshWriter() as writer:
+            writer.add(self.product, {
+                'title': 'Phone', 'price': 90, 'currency': '₹', 'image_url': None, 'error': None,
+            })
+        self.assertIsNone(self.cached())
+        self.assertEqual(get_deal_summary(self.user)['deals'], 1)
+
+
+class PriceHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('history')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            user=self.user, name='Phone', url='https://www.amazon.in/dp/B3', target_price=50,
+        )
+        # 09:00 in TIME_ZONE, which the rollup buckets follow
+        self.start = datetime(2026, 1, 1, 3, 30, tzinfo=dt_timezone.utc)
+
+    def observations(self, prices):
+        return [(self.product, price, self.start + timedelta(minutes=10 * i)) for i, price in enumerate(prices)]
+
+    def test_record_prices_stores_changes(self):
+        created = record_prices(self.observations([100, 100, 90, 100]), mode=MODE_CHANGES)
+        self.assertEqual(len(created), 3)
+        rows = list(self.product.price_history.order_by('timestamp').values_list('price', 'observations', 'timestamp', 'last_seen'))
+        self.assertEqual([(price, n) for price, n, timestamp, last_seen in rows], [(100, 2), (90, 1), (100, 1)])
+        self.assertEqual(rows[0][3], self.start + timedelta(minutes=10))
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.lowest_price, product.highest_price), (Decimal('90.00'), Decimal('100.00')))
+        self.assertEqual(product.price_change_count, 2)
+        self.assertEqual(product.price_changed_at, self.start + timedelta(minutes=30))
+
+    def test_record_prices_stores_every_observation(self):
+        record_prices(self.observations([100, 100, 90]), mode=MODE_ALL)
+        self.assertEqual(self.product.price_history.count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).price_change_count, 1)
+
+    def test_update_rollups(self):
+        update_rollups(self.observations([100, 120, 90, 110]) + [(self.product, 80, self.start + timedelta(hours=1))])
+        hour, next_hour = self.product.price_rollups.filter(resolution=PriceRollup.RESOLUTION_HOUR).order_by('bucket')
+        self.assertEqual(hour.bucket, self.start)
+        self.assertEqual(
+            (hour.open, hour.high, hour.low, hour.close, hour.count, hour.price_sum),
+            (100, 120, 90, 110, 4, 420),
+        )
+        self.assertEqual((next_hour.open, next_hour.count), (80, 1))
+        day = self.product.price_rollups.get(resolution=PriceRollup.RESOLUTION_DAY)
+        self.assertEqual((day.open, day.low, day.close, day.count), (100, 80, 80, 5))
+
+        # Folding more observations into an existing bucket
+        update_rollups([(self.product, 130, self.start + timedelta(minutes=50))])
+        hour.refresh_from_db()
+        self.assertEqual((hour.high, hour.close, hour.count), (130, 130, 5))
+
+    def test_archive_round_trip(self):
+        record_prices(self.observations([100, 100, 90, 95]), mode=MODE_CHANGES)
+        expected = list(self.product.price_history.order_by('timestamp').values_list('timestamp', 'price', 'last_seen', 'observations'))
+
+        self.assertEqual(archive_history_batch(self.start + timedelta(minutes=25), batch_size=10), 2)
+        self.assertEqual(self.product.price_history.count(), 1)
+        self.assertEqual(archive_history_batch(self.start + timedelta(days=1), batch_size=10), 1)
+        self.assertEqual(archive_history_batch(self.start + timedelta(days=1), batch_size=10), 0)
+
+        archives = self.product.history_archives.order_by('start')
+        self.assertEqual([archive.row_count for archive in archives], [2, 1])
+        self.assertEqual(list(unpack_history(archives[0].data)), expected[:2])
+        self.assertEqual(
+            [(row.timestamp, row.price, row.last_seen, row.observations) for row in archived_history([self.product.pk])],
+            expected,
+        )
+
+
+class PriceRollupTests(TestCase):
+    def rollups(self, product):
+        return list(product.price_rollups.order_by('resolution', 'bucket').values_list(
+            'resolution', 'bucket', 'open', 'high', 'low', 'close', 'count', 'price_sum',
+        ))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        user = User.objects.create_user('rollups')
+        product = Product.objects.create(user=user, name='Phone', url='https://www.amazon.in/dp/B2', target_price=50)
+        start = datetime(2026, 1, 1, 3, 10, tzinfo=dt_timezone.utc)
+        # Every 20 minutes for three days, with a price held across hours and days
+        observations = [
+            (product, 100 if i < 90 or i >= 150 else 90, start + timedelta(minutes=20 * i))
+            for i in range(216)
+        ]
+        for i in range(0, len(observations), 10):
+            record_prices(observations[i:i + 10], mode=MODE_CHANGES)
+        self.assertEqual(product.price_history.count(), 3)
+        incremental = self.rollups(product)
+
+        product.price_rollups.all().delete()
+        update_rollups(list(history_observations(product.price_history.order_by('timestamp'))))
+        self.assertEqual(self.rollups(product), incremental)
+        self.assertEqual(sum(row[6] for row in incremental if row[0] == PriceRollup.RESOLUTION_DAY), 216)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('searcher')
+
+    def create(self, name):
+        return Product.objects.create(user=self.user, name=name, url=f'https://www.amazon.in/dp/{name[:8]}', target_price=1)
+
+    def search(self, query):
+        return [product.name for product in find_products(Product.objects.filter(user=self.user), query)]
+
+    def test_products_added_after_migrations_are_indexed(self):
+        self.create('Apple iPhone 15 Black')
+        self.assertEqual(self.search('iph'), ['Apple iPhone 15 Black'])
+        self.assertEqual(self.search('apple black'), ['Apple iPhone 15 Black'])
+
+    def test_prefix_terms_all_match(self):
+        self.create('Apple iPhone 15 Black')
+        self.create('Samsung Galaxy S24')
+        self.create('Amazon Echo Dot')
+        self.assertEqual(self.search('am'), ['Amazon Echo Dot'])
+        self.assertEqual(self.search('gal s2'), ['Samsung Galaxy S24'])
+        self.assertEqual(self.search('apple galaxy'), [])
+
+    def test_rename_and_delete_update_index(self):
+        product = self.create('Old Kettle')
+        product.name = 'Steel Toaster'
+        product.save()
+        self.assertEqual(self.search('kettle'), [])
+        self.assertEqual(self.search('toast'), ['Steel Toaster'])
+
+        Product.objects.filter(pk=product.pk).update(name='Steel Blender')
+        self.assertEqual(self.search('blend'), ['Steel Blender'])
+
+        product.delete()
+        self.assertEqual(self.search('steel'), [])
+
+    def test_bulk_created_products_are_indexed(self):
+        Product.objects.bulk_create([
+            Product(user=self.user, name=f'Bulk Item {i}', url=f'https://www.amazon.in/dp/BULK{i}', target_price=1)
+            for i in range(3)
+        ])
+        self.assertEqual(len(self.search('bulk item')), 3)
+
+    def test_other_users_products_are_excluded(self):
+        other = User.objects.create_user('other')
+        Product.objects.create(user=other, name='Apple Watch', url='https://www.amazon.in/dp/W', target_price=1)
+        self.assertEqual(self.search('apple'), [])
+
+    def test_icontains_fallback(self):
+        self.create('Apple iPhone 15+ Black')
+        # No word characters to search the index with
+        self.assertEqual(self.search('+'), ['Apple iPhone 15+ Black'])
+        self.assertEqual(self.search('++'), [])
+        with mock.patch('tracker.search.has_fts_table', return_value=False):
+            self.assertEqual(self.search('phone'), ['Apple iPhone 15+ Black'])
+
+    def test_better_matches_rank_first(self):
+        self.create('Apple iPhone 15 Black')
+        self.create('Black Case for Apple iPhone 15 Pro Max with Kickstand')
+        self.assertEqual(self.search('black'), [
+            'Apple iPhone 15 Black', 'Black Case for Apple iPhone 15 Pro Max with Kickstand',
+        ])
+
+    def test_index_is_matched_once(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Checks the SQLite FTS5 plan")
+        # Matches and their rank come from one pass over the index; a
+        # correlated rank lookup would re-run MATCH for every candidate
+        plan = find_products(Product.objects.filter(user=self.user), 'apple black').explain()
+        self.assertEqual(plan.count('VIRTUAL TABLE INDEX'), 1)
+        self.assertNotIn('CORRELATED', plan)
+        self.assertNotRegex(plan, r'SCAN tracker_product(?!_fts)')
+
+
+class RefreshJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('jobs')
+        cls.manifest = load_manifest()
+
+    def test_enqueue_reuses_pending_job(self):
+        job = enqueue_refresh(self.user)
+        self.assertEqual(enqueue_refresh(), job)
+        self.assertEqual(claim_next_job(), job)
+        self.assertEqual(enqueue_refresh(), job)
+        self.assertIsNone(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, RefreshJob.STATUS_RUNNING)
+        self.assertIsNotNone(job.started_at)
+
+    def test_run_job(self):
+        entry = self.manifest['product'][0]
+        found = Product.objects.create(user=self.user, name='Found', url=entry['url'], target_price=1)
+        Product.objects.create(user=self.user, name='Missing', url='https://www.amazon.in/dp/MISSING', target_price=1)
+        Product.objects.create(user=self.user, name='Paused', url='https://www.amazon.in/dp/PAUSED', target_price=1, is_active=False)
+
+        enqueue_refresh(self.user)
+        with sessions.using_adapter(FixtureAdapter(self.manifest)):
+            job = run_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.done, job.failed), (RefreshJob.STATUS_DONE, 2, 1, 1))
+        self.assertIn('Missing', job.error)
+        found.refresh_from_db()
+        self.assertEqual(found.current_price, Decimal(str(entry['expected']['price'])))
+        self.assertEqual(found.price_history.count(), 1)
+
+    def test_fetch_pending_products(self):
+        entry = self.manifest['product'][1]
+        pending = Product.objects.create(
+            user=self.user, name=entry['url'], url=entry['url'], target_price=1, fetch_status=Product.FETCH_PENDING,
+        )
+        # No price on the page; found through the marketplace search instead
+        fallback = Product.objects.create(
+            user=self.user, name='Apple iPhone 15', url='https://www.amazon.in/dp/GONE', target_price=1,
+            fetch_status=Product.FETCH_PENDING,
+        )
+        failed = Product.objects.create(
+            user=self.user, name='https://www.amazon.in/dp/GONE2', url='https://www.amazon.in/dp/GONE2',
+            target_price=1, fetch_status=Product.FETCH_PENDING,
+        )
+        done = Product.objects.create(user=self.user, name='Done', url='https://www.amazon.in/dp/DONE', target_price=1)
+
+        self.assertEqual([product.pk for product in claim_pending_products(limit=1)], [pending.pk])
+        self.assertEqual(Product.objects.get(pk=pending.pk).fetch_status, Product.FETCH_RUNNING)
+        Product.objects.filter(pk=pending.pk).update(fetch_status=Product.FETCH_PENDING)
+
+        caches[SEARCH_CACHE_ALIAS].clear()
+        with sessions.using_adapter(FixtureAdapter(self.manifest)):
+            self.assertEqual(fetch_pending_products(), 3)
+            self.assertEqual(fetch_pending_products(), 0)
+
+        statuses = dict(Product.objects.values_list('pk', 'fetch_status'))
+        self.assertEqual(statuses, {
+            pending.pk: Product.FETCH_OK, fallback.pk: Product.FETCH_OK,
+            failed.pk: Product.FETCH_FAILED, done.pk: Product.FETCH_OK,
+        })
+        pending.refresh_from_db()
+        self.assertEqual((pending.name, pending.current_price), (entry['expected']['title'], Decimal(str(entry['expected']['price']))))
+        self.assertIsNotNone(Product.objects.get(pk=fallback.pk).current_price)
+        self.assertEqual(fallback.price_history.count(), 1)
+
+    def test_worker_fetches_pending_between_chunks(self):
+        for entry in self.manifest['product'][:2]:
+            Product.objects.create(user=self.user, name='Tracked', url=entry['url'], target_price=1)
+        entry = self.manifest['product'][2]
+        events = []
+
+        def refresh(products, **kwargs):
+            if not events:
+                # Added while the job is running
+                Product.objects.create(
+                    user=self.user, name=entry['url'], url=entry['url'], target_price=1,
+                    fetch_status=Product.FETCH_PENDING,
+                )
+            events.append('refresh')
+            return refresh_products(products, **kwargs)
+
+        def fetch(*args, **kwargs):
+            fetched = fetch_pending_products(*args, **kwargs)
+            if fetched:
+                events.append('fetch')
+            return fetched
+
+        enqueue_refresh(self.user)
+        with sessions.using_adapter(FixtureAdapter(self.manifest)), \
+                mock.patch('tracker.jobs.JOB_CHUNK_SIZE', 1), \
+                mock.patch('tracker.jobs.refresh_products', refresh), \
+                mock.patch('tracker.jobs.fetch_pending_products', fetch):
+            run_worker(once=True)
+
+        self.assertEqual(events, ['refresh', 'fetch', 'refresh'])
+        self.assertEqual(Product.objects.get(url=entry['url'], fetch_status=Product.FETCH_OK).current_price, Decimal(str(entry['expected']['price'])))
+        job = RefreshJob.objects.get()
+        self.assertEqual((job.status, job.total, job.done, job.failed), (RefreshJob.STATUS_DONE, 2, 2, 0))
+
+    def test_failed_fetch_backs_off(self):
+        product = Product.objects.create(
+            user=self.user, name='Gone', url='https://www.amazon.in/dp/GONE', target_price=1,
+            fetch_status=Product.FETCH_FAILED, fetch_error='No price found', fetch_claimed_at=timezone.now(),
+        )
+        self.client.force_login(self.user)
+        url = reverse('product_detail', args=[product.pk])
+
+        self.client.get(url)
+        self.assertEqual(Product.objects.get(pk=product.pk).fetch_status, Product.FETCH_FAILED)
+
+        Product.objects.filter(pk=product.pk).update(fetch_claimed_at=timezone.now() - timedelta(minutes=11))
+        self.client.get(url)
+        product.refresh_from_db()
+        self.assertEqual((product.fetch_status, product.fetch_error), (Product.FETCH_PENDING, ''))
+
+    def test_reset_interrupted_fetches_keeps_live_claims(self):
+        now = timezone.now()
+        live = Product.objects.create(
+            user=self.user, name='Live', url='https://www.amazon.in/dp/LIVE', target_price=1,
+            fetch_status=Product.FETCH_RUNNING, fetch_claimed_at=now,
+        )
+        stale = Product.objects.create(
+            user=self.user, name='Stale', url='https://www.amazon.in/dp/STALE', target_price=1,
+            fetch_status=Product.FETCH_RUNNING, fetch_claimed_at=now - timedelta(hours=1),
+        )
+        self.assertEqual(reset_interrupted_fetches(), 1)
+        statuses = dict(Product.objects.values_list('pk', 'fetch_status'))
+        self.assertEqual(statuses, {live.pk: Product.FETCH_RUNNING, stale.pk: Product.FETCH_PENDING})
+
+
+class SearchCacheTests(TestCase):
+    def test_search_cache_stats(self):
+        user = User.objects.create_user('shopper')
+        staff = User.objects.create_user('staff', is_staff=True)
+        caches[SEARCH_CACHE_ALIAS].clear()
+        before = search_stats.as_dict()
+        with sessions.using_adapter(FixtureAdapter()):
+            first = cached_search_marketplaces('Apple iPhone')
+            self.assertEqual(cached_search_marketplaces('  apple   IPHONE '), first)
+        after = search_stats.as_dict()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('search_cache_stats')).status_code, 403)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('search_cache_stats')).json(), after)
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_parse_import(self):
+        expected = [('https://www.amazon.in/dp/A', '100'), ('https://www.amazon.in/dp/B', '200')]
+        self.assertEqual(parse_import('url,target_price\nhttps://www.amazon.in/dp/A,100\n\nhttps://www.amazon.in/dp/B,200\n'), expected)
+        self.assertEqual(parse_import(b'\xef\xbb\xbfhttps://www.amazon.in/dp/A,100\r\nhttps://www.amazon.in/dp/B,200'), expected)
+        self.assertEqual(parse_import('{"items": [{"url": "https://www.amazon.in/dp/A", "target_price": "100"}, ["https://www.amazon.in/dp/B", "200"]]}'), expected)
+        self.assertEqual(parse_import('[1]', 'application/json'), [(None, None)])
+        for content in ('[', '{"items": 1}', b'\xff'):
+            with self.subTest(content=content):
+                with self.assertRaises(ImportFormatError):
+                    parse_import(content)
+
+    def test_create_import_deduplicates(self):
+        tracked = Product.objects.create(user=self.user, name='Tracked', url='https://www.amazon.in/dp/T', target_price=1)
+        job = create_import(self.user, [
+            ('https://www.amazon.in/dp/A', '100'),
+            ('https://www.amazon.in/dp/A#reviews', '90'),
+            ('https://www.amazon.in/dp/T', '100'),
+            ('not a url', '100'),
+            ('https://www.amazon.in/dp/B', '-1'),
+            (None, None),
+        ])
+        rows = list(job.rows.order_by('line').values_list('status', 'error', 'product_id'))
+        created = Product.objects.get(user=self.user, url='https://www.amazon.in/dp/A')
+        self.assertEqual(rows, [
+            (ImportRow.STATUS_CREATED, '', created.pk),
+            (ImportRow.STATUS_DUPLICATE, 'Repeated in this import', created.pk),
+            (ImportRow.STATUS_DUPLICATE, 'Already tracked', tracked.pk),
+            (ImportRow.STATUS_INVALID, 'Invalid URL', None),
+            (ImportRow.STATUS_INVALID, 'Invalid target price', None),
+            (ImportRow.STATUS_INVALID, 'Missing URL', None),
+        ])
+        self.assertEqual((created.fetch_status, created.target_price), (Product.FETCH_PENDING, Decimal('100.00')))
+
+        status = import_status(job)
+        self.assertEqual((status['status'], status['total']), ('running', 6))
+        self.assertEqual(status['counts'], {'pending': 1, 'duplicate': 2, 'invalid': 3})
+        Product.objects.filter(pk=created.pk).update(fetch_status=Product.FETCH_FAILED, fetch_error='No price found')
+        status = import_status(job)
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['rows'][0]['error'], 'No price found')
+
+    def test_import_command_fetches_only_its_products(self):
+        manifest = load_manifest()
+        other = User.objects.create_user('other')
+        queued = Product.objects.create(
+            user=other, name='Queued', url=manifest['product'][1]['url'], target_price=1,
+            fetch_status=Product.FETCH_PENDING,
+        )
+        claimed = Product.objects.create(
+            user=other, name='Claimed', url=manifest['product'][2]['url'], target_price=1,
+            fetch_status=Product.FETCH_RUNNING, fetch_claimed_at=timezone.now(),
+        )
+        entry = manifest['product'][0]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'products.csv'
+            path.write_text(f"{entry['url']},100\n")
+            with sessions.using_adapter(FixtureAdapter(manifest)):
+                call_command('import_products', str(path), '--user', 'importer', '--fetch', stdout=StringIO())
+
+        imported = Product.objects.get(user=self.user)
+        self.assertEqual((imported.fetch_status, imported.current_price), (Product.FETCH_OK, Decimal(str(entry['expected']['price']))))
+        self.assertEqual(Product.objects.get(pk=queued.pk).fetch_status, Product.FETCH_PENDING)
+        self.assertEqual(Product.objects.get(pk=claimed.pk).fetch_status, Product.FETCH_RUNNING)
+
+    def test_import_api(self):
+        response = self.client.post(
+            reverse('api_import_products'),
+            '[{"url": "https://www.amazon.in/dp/A", "target_price": 100}]', content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['counts'], {'pending': 1})
+        status = self.client.get(data['status_url'] + '?rows=0').json()
+        self.assertEqual((status['id'], status['counts']), (data['id'], {'pending': 1}))
+        self.assertNotIn('rows', status)
+
+        self.assertEqual(self.client.post(reverse('api_import_products'), '[', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(reverse('api_import_products'), '', content_type='text/csv').status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_import_products')).status_code, 405)
+
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(data['status_url']).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(data['status_url']).status_code, 401)
+
+
+class HistoryViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer')
+        cls.product = Product.objects.create(user=cls.user, name='Phone', url='https://www.amazon.in/dp/V', target_price=50)
+        start = datetime(2026, 1, 1, 3, 30, tzinfo=dt_timezone.utc)
+        record_prices([(cls.product, 100 + i, start + timedelta(minutes=10 * i)) for i in range(5)])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('get_price_history', args=[self.product.pk])
+
+    def test_rollup_resolutions(self):
+        data = self.client.get(self.url, {'resolution': 'hour'}).json()
+        self.assertEqual((data['open'], data['prices'], data['count']), ([100], [104], [5]))
+        self.assertEqual(self.client.get(self.url, {'resolution': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'from': 'soon'}).status_code, 400)
+
+    def test_auto_serves_raw_rows_until_rollups_are_rebuilt(self):
+        # History recorded before rollups existed
+        self.product.price_rollups.all().delete()
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['resolution'], RESOLUTION_RAW)
+        self.assertEqual(data['prices'][:5], [100, 101, 102, 103, 104])
+
+        # Only the product whose history predates its first rollup is rebuilt
+        other = Product.objects.create(user=self.user, name='Tablet', url='https://www.amazon.in/dp/T', target_price=50)
+        record_prices([(other, 200, timezone.now())])
+        record_prices([(self.product, 110, timezone.now())])
+        out = StringIO()
+        call_command('rebuild_price_rollups', '--missing', stdout=out)
+        self.assertIn('1/1 products', out.getvalue())
+        data = self.client.get(self.url).json()
+        self.assertEqual((data['resolution'], sum(data['count'])), ('day', 6))
+
+        out = StringIO()
+        call_command('rebuild_price_rollups', '--missing', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_columnar_pages(self):
+        timestamps, prices = [], []
+        cursor = ''
+        while cursor is not None:
+            data = self.client.get(self.url, {'format': 'columnar', 'limit': 2, 'cursor': cursor}).json()
+            timestamps += data['timestamps']
+            prices += data['prices']
+            cursor = data['next_cursor']
+        self.assertEqual(prices, [100, 101, 102, 103, 104])
+        self.assertEqual([b - a for a, b in zip(timestamps, timestamps[1:])], [600] * 4)
+
+        data = self.client.get(self.url, {'format': 'columnar', 'delta': 1}).json()
+        self.assertEqual(data['timestamps'][1:], [600] * 4)
+        self.assertEqual(self.client.get(self.url, {'format': 'columnar', 'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'format': 'columnar', 'resolution': 'day'}).status_code, 400)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(lines[0], {'resolution': 'raw', 'currency': self.product.currency, 'delta': False})
+        self.assertEqual(lines[1]['prices'], [100, 101, 102, 103, 104])
+
+
+class ConditionalResponseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('revalidator')
+        cls.product = Product.objects.create(user=cls.user, name='Phone', url='https://www.amazon.in/dp/C', target_price=50)
+        record_prices([(cls.product, 100, timezone.now())])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('get_price_history', args=[self.product.pk])
+
+    def test_history_not_modified_until_checked(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'resolution': 'day'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Product.objects.filter(pk=self.product.pk).update(last_checked=timezone.now())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_list_not_modified_until_products_change(self):
+        url = reverse('product_list')
+        # The first render sets the CSRF cookie, which the ETag covers
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Product.objects.create(user=self.user, name='Tablet', url='https://www.amazon.in/dp/W', target_price=50)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('metrics')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    @override_settings(METRICS_SAMPLE_RATE=1, METRICS_TOKEN='secret')
+    def test_sampled_requests_are_exported(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('product_list'))
+        self.assertEqual(registry.requests, {('product_list', 'GET', '200'): 1})
+        self.assertGreater(registry.db_queries['product_list'], 0)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('tracker_requests_total{view="product_list",method="GET",status="200"} 1', text)
+        self.assertIn('tracker_search_cache_requests_total{result="hit"}', text)
+
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('product_list'))
+        self.assertEqual(registry.requests, {})
@@ -9,11 +9,17 @@ urlpatterns = [
     path('search/', views.search_tracked_products, name='search_tracked_products'),
     path('add/', views.add_product, name='add_product'),
     path('update/', views.update_prices, name='update_prices'),
+    path('api/refresh/<int:job_id>/', views.refresh_status, name='refresh_status'),
     path('delete/<int:product_id>/', views.delete_product, name='delete_product'),
     path('api/search_alternatives/<int:product_id>/', views.search_alternatives, name='search_alternatives'),
     path('api/search/', views.api_search_products, name='api_search_products'),
+    path('api/import/', views.api_import_products, name='api_import_products'),
+    path('api/import/<int:job_id>/', views.import_job_status, name='import_status'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('api/search_cache/', views.search_cache_stats, name='search_cache_stats'),
     path('history/<int:product_id>/', views.get_price_history, name='get_price_history'),
     path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('api/product/<int:product_id>/status/', views.product_status, name='product_status'),
     path('login/', auth_views.LoginView.as_view(template_name='tracker/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='dashboard'), name='logout'),
     path('signup/', views.signup, name='signup'),
@@ -1,52 +1,65 @@
+import json
+from itertools import islice
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from .models import Product, PriceHistory
-from .scraper import get_product_details, search_products
+from .models import ImportJob, Product, RefreshJob
+from .cache import cached_search_marketplaces, get_deal_summary, search_stats
+from .search import find_products
+from .conditional import conditional_view, history_state, product_list_state
+from .metrics import registry
+from .imports import create_import, import_status, parse_import, ImportFormatError
+from .history import (
+    RESOLUTION_RAW, RESOLUTIONS, auto_resolution, bucket_start, parse_bound, step_series,
+    decode_cursor, encode_columns, encode_cursor, raw_history_rows,
+)
 from django.utils import timezone
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.urls import reverse
 
 def dashboard(request):
     if not request.user.is_authenticated:
         return redirect('login')
-    products = Product.objects.filter(user=request.user).order_by('-created_at')
-    total_items = products.count()
-    deals_found = sum(1 for p in products if p.is_below_threshold)
+    stats = get_deal_summary(request.user)
+    # Only the five most recent products are displayed
+    products = list(Product.objects.filter(user=request.user).order_by('-created_at')[:5])
     
-    total_savings = sum(
-        (p.target_price - p.current_price) 
-        for p in products 
-        if p.is_below_threshold and p.current_price and p.target_price
-    )
+    refresh_job = RefreshJob.objects.filter(
+        status__in=[RefreshJob.STATUS_QUEUED, RefreshJob.STATUS_RUNNING]
+    ).first()
     
     context = {
         'products': products,
-        'total_items': total_items,
-        'deals_found': deals_found,
-        'total_savings': total_savings,
+        'total_items': stats['total'],
+        'deals_found': stats['deals'],
+        'total_savings': stats['savings'],
+        'refresh_job': refresh_job,
     }
     return render(request, 'tracker/dashboard.html', context)
 
+@conditional_view(product_list_state)
 def product_list(request):
     if not request.user.is_authenticated:
         return redirect('login')
     products = Product.objects.filter(user=request.user).order_by('-created_at')
     return render(request, 'tracker/product_list.html', {'products': products})
 
+@conditional_view(product_list_state)
 def deal_list(request):
     if not request.user.is_authenticated:
         return redirect('login')
-    # Get all products for the user
-    all_products = Product.objects.filter(user=request.user).order_by('-created_at')
-    # Filter for deals in python since is_below_threshold is likely a property
-    deals = [p for p in all_products if p.is_below_threshold]
+    deals = Product.objects.filter(user=request.user).deals().order_by('-created_at')
     return render(request, 'tracker/deal_list.html', {'products': deals})
 
+@conditional_view(product_list_state)
 def search_tracked_products(request):
     if not request.user.is_authenticated:
         return redirect('login')
     
     query = request.GET.get('q', '')
-    products = Product.objects.filter(user=request.user, name__icontains=query).order_by('-created_at')
+    products = find_products(Product.objects.filter(user=request.user), query)
     
     context = {
         'products': products,
@@ -54,6 +67,7 @@ def search_tracked_products(request):
     }
     return render(request, 'tracker/product_list.html', context)
 
+@conditional_view(product_list_state)
 def api_search_products(request):
     """API endpoint for live search."""
     if not request.user.is_authenticated:
@@ -63,7 +77,7 @@ def api_search_products(request):
     if len(query) < 2:
         return JsonResponse({'results': []})
         
-    products = Product.objects.filter(user=request.user, name__icontains=query).order_by('-created_at')[:5]
+    products = find_products(Product.objects.filter(user=request.user), query)[:5]
     
     results = []
     for p in products:
@@ -79,6 +93,11 @@ def api_search_products(request):
     return JsonResponse({'results': results})
 
 def add_product(request):
+    """
+    Starts tracking a URL. The product is created pending, named after its
+    URL; the refresh_prices worker scrapes its title, image, currency and
+    first price in the background.
+    """
     if request.method == 'POST':
         url = request.POST.get('url')
         target_price = request.POST.get('target_price')
@@ -86,29 +105,14 @@ def add_product(request):
         if url and target_price:
             try:
                 target_price = float(target_price)
-                details = get_product_details(url)
-                
-                if details['error']:
-                    messages.error(request, f"Error scraping URL: {details['error']}")
-                else:
-                    product = Product.objects.create(
-                        name=details['title'] or "Unknown Product",
-                        url=url,
-                        image_url=details.get('image_url'),
-                        currency=details.get('currency', '₹'),
-                        target_price=target_price,
-                        current_price=details['price'],
-                        last_checked=timezone.now() if details['price'] else None,
-                        user=request.user
-                    )
-                    
-                    if details['price']:
-                        PriceHistory.objects.create(
-                            product=product,
-                            price=details['price']
-                        )
-                    
-                    messages.success(request, "Product added successfully!")
+                Product.objects.create(
+                    name=url,
+                    url=url,
+                    target_price=target_price,
+                    fetch_status=Product.FETCH_PENDING,
+                    user=request.user
+                )
+                messages.success(request, "Product added! Its details will appear once they have been fetched.")
             except ValueError:
                 messages.error(request, "Invalid target price.")
         else:
@@ -116,79 +120,34 @@ def add_product(request):
             
     return redirect('dashboard')
 
-from django.core.mail import send_mail
-from django.conf import settings
+from .jobs import enqueue_refresh, requeue_fetch
 
 def update_prices(request):
-    products = Product.objects.filter(is_active=True)
-    updated_count = 0
-    
-    for product in products:
-        details = get_product_details(product.url)
-        if not details['error'] and details['price']:
-            old_price = product.current_price
-            product.current_price = details['price']
-            if details.get('image_url'):
-                product.image_url = details['image_url']
-            
-            if details.get('currency'):
-                product.currency = details['currency']
-            
-            # Only update title if it's valid and not in blacklist
-            new_title = details.get('title')
-            BLACKLIST_TITLES = ["Add to your order", "Amazon.in", "Shopping Cart", "Page Not Found", "Unknown Product"]
-            
-            if new_title and new_title not in BLACKLIST_TITLES:
-                product.name = new_title
-                
-            product.last_checked = timezone.now()
-            product.save()
-            
-            PriceHistory.objects.create(
-                product=product,
-                price=details['price']
-            )
-            updated_count += 1
-            
-            # Check for price drop and send email
-            # Check for price drop and send email
-            if product.is_below_threshold:
-                print(f"DEBUG: Product {product.name} is below threshold!")
-                print(f"DEBUG: Current: {product.current_price}, Target: {product.target_price}")
-                
-                subject = f"Price Drop Alert: {product.name}"
-                message = f"Good news! The price for {product.name} has dropped to {product.current_price}. This is below your target of {product.target_price}.\n\nCheck it out here: {product.url}"
-                from_email = settings.EMAIL_HOST_USER
-                
-                # Send to the product owner if they exist and have an email
-                recipient_list = []
-                if product.user and product.user.email:
-                    recipient_list = [product.user.email]
-                else:
-                    # Fallback or skip? For now, let's log it.
-                    print(f"DEBUG: No user linked to product {product.name}, skipping email.")
-                
-                if recipient_list:
-                    print(f"DEBUG: Sending email to {recipient_list}")
-                
-                try:
-                    send_mail(subject, message, from_email, recipient_list)
-                    print(f"DEBUG: Email sent successfully for {product.name}")
-                except Exception as e:
-                    print(f"DEBUG: Failed to send email: {e}")
-            else:
-                print(f"DEBUG: Product {product.name} is NOT below threshold. Current: {product.current_price}, Target: {product.target_price}")
+    """Queues a background price refresh; the refresh_prices worker runs it."""
+    job = enqueue_refresh(request.user)
+    if job.status == RefreshJob.STATUS_RUNNING:
+        messages.info(request, f"A price refresh is already running ({job.done + job.failed}/{job.total} checked).")
+    else:
+        messages.info(request, "Price refresh queued. Prices will update in the background.")
+    return redirect('dashboard')
 
+def refresh_status(request, job_id):
+    """API endpoint reporting progress of a refresh job."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
 
-        elif details['error']:
-            messages.warning(request, f"Failed to update {product.name}: {details['error']}")
-            
-    if updated_count > 0:
-        messages.success(request, f"Updated {updated_count} products.")
-    elif not messages.get_messages(request):
-        messages.info(request, "No products updated.")
-        
-    return redirect('dashboard')
+    job = get_object_or_404(RefreshJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'done': job.done,
+        'failed': job.failed,
+        'remaining': job.remaining,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
 
 def delete_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
@@ -196,58 +155,126 @@ def delete_product(request, product_id):
     messages.success(request, "Product deleted.")
     return redirect('dashboard')
 
+@conditional_view(history_state)
 def get_price_history(request, product_id):
+    """
+    Price history for charts. ?resolution=raw|hour|day|auto (default auto)
+    with optional ?from=/?to= (ISO date or datetime) bounds; hourly and
+    daily data come from the OHLC rollups.
+
+    ?format=columnar or ?format=ndjson serve raw rows compactly instead;
+    see columnar_history.
+    """
     product = get_object_or_404(Product, id=product_id)
-    history = product.price_history.all().order_by('timestamp')
+    try:
+        start = parse_bound(request.GET.get('from'))
+        end = parse_bound(request.GET.get('to'), end=True)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    resolution = request.GET.get('resolution', 'auto')
     
-    data = {
-        'labels': [h.timestamp.strftime('%Y-%m-%d %H:%M:%S') for h in history],
-        'prices': [float(h.price) for h in history],
-        'currency': product.currency
-    }
+    if request.GET.get('format') in ('columnar', 'ndjson'):
+        if resolution not in ('auto', RESOLUTION_RAW):
+            return JsonResponse({'error': "Columnar formats serve raw history only"}, status=400)
+        return columnar_history(request, product, start, end)
+    auto = resolution == 'auto'
+    if auto:
+        resolution = auto_resolution(product, start, end)
+    elif resolution not in RESOLUTIONS:
+        return JsonResponse({'error': f"Unknown resolution: {resolution}"}, status=400)
     
-    from django.http import JsonResponse
+    if resolution != RESOLUTION_RAW:
+        rollups = product.price_rollups.filter(resolution=resolution).order_by('bucket')
+        if start:
+            rollups = rollups.filter(bucket__gte=bucket_start(start, resolution))
+        if end:
+            rollups = rollups.filter(bucket__lt=end)
+        rollups = list(rollups)
+        # History recorded before rollups existed has none until
+        # rebuild_price_rollups runs; serve its raw rows meanwhile
+        if auto and not rollups:
+            resolution = RESOLUTION_RAW
+    
+    if resolution == RESOLUTION_RAW:
+        history = product.price_history.all().order_by('timestamp')
+        if start:
+            history = history.filter(last_seen__gte=start)
+        if end:
+            history = history.filter(timestamp__lt=end)
+        # Rows only mark price changes; expand them back into the observed series
+        points = step_series(history)
+        data = {
+            'labels': [timestamp.strftime('%Y-%m-%d %H:%M:%S') for timestamp, price in points],
+            'prices': [float(price) for timestamp, price in points],
+        }
+    else:
+        data = {
+            'labels': [timezone.localtime(r.bucket).strftime('%Y-%m-%d %H:%M:%S') for r in rollups],
+            # Closing prices, so existing line charts keep working
+            'prices': [float(r.close) for r in rollups],
+            'open': [float(r.open) for r in rollups],
+            'high': [float(r.high) for r in rollups],
+            'low': [float(r.low) for r in rollups],
+            'count': [r.count for r in rollups],
+        }
+    
+    data['resolution'] = resolution
+    data['currency'] = product.currency
     return JsonResponse(data)
 
-from django.db.models import Min
+# Rows per page of ?format=columnar history, and per line of ?format=ndjson
+HISTORY_PAGE_SIZE = 1000
+HISTORY_MAX_PAGE_SIZE = 10000
+
+def columnar_history(request, product, start, end):
+    """
+    Raw price history as columns (see history.encode_columns), with
+    ?delta=1 for delta-encoded timestamps.
+
+    format=columnar returns one page of ?limit= rows (default 1000) after
+    ?cursor=, plus next_cursor while more rows remain. format=ndjson
+    streams the whole range: a header line, then one columnar chunk per
+    line, without holding the series in memory.
+    """
+    delta = request.GET.get('delta') in ('1', 'true')
+    header = {'resolution': RESOLUTION_RAW, 'currency': product.currency, 'delta': delta}
+    
+    if request.GET.get('format') == 'ndjson':
+        rows = raw_history_rows(product, start, end).iterator(chunk_size=HISTORY_PAGE_SIZE)
+        
+        def lines():
+            yield json.dumps(header) + "\n"
+            while True:
+                chunk = list(islice(rows, HISTORY_PAGE_SIZE))
+                if not chunk:
+                    return
+                yield json.dumps(encode_columns(chunk, delta=delta)) + "\n"
+        
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    
+    try:
+        after = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        limit = min(max(1, int(request.GET.get('limit', HISTORY_PAGE_SIZE))), HISTORY_MAX_PAGE_SIZE)
+    except (ValueError, OverflowError):
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+    
+    rows = list(raw_history_rows(product, start, end, after=after)[:limit + 1])
+    page = rows[:limit]
+    data = dict(header, **encode_columns(page, delta=delta))
+    data['next_cursor'] = encode_cursor(page[-1][0], page[-1][3]) if len(rows) > limit else None
+    return JsonResponse(data)
 
 def product_detail(request, product_id):
     """View product details and price history."""
     product = get_object_or_404(Product, id=product_id)
     
-    # Auto-fetch price if it's None
-    if product.current_price is None:
-        details = get_product_details(product.url)
-        if not details['error'] and details['price']:
-            product.current_price = details['price']
-            product.save()
-            # Also create price history entry
-            PriceHistory.objects.create(
-                product=product,
-                price=details['price']
-            )
-        else:
-            # Fallback: Use search scraper if product page scraper fails
-            # Search scrapers are more reliable than product page scrapers
-            search_query = " ".join(product.name.split()[:5])
-            search_results = search_products(search_query)
-            
-            # Use the first result's price if available
-            if search_results and len(search_results) > 0:
-                first_result = search_results[0]
-                product.current_price = first_result['price']
-                product.save()
-                # Create price history entry
-                PriceHistory.objects.create(
-                    product=product,
-                    price=first_result['price']
-                )
-    
-    # Get price history for chart
-    history = product.price_history.all().order_by('timestamp')
+    # No price yet: queue a fetch for the background worker (unless one
+    # failed moments ago) and render straight away; the page polls
+    # product_status until the price lands
+    requeue_fetch(product)
     
-    # Calculate lowest price
-    lowest_price = product.price_history.aggregate(Min('price'))['price__min']
+    # Maintained on the product by the history writer; no history scan
+    lowest_price = product.lowest_price
     
     # Calculate deal score (0-100)
     deal_score = 0
@@ -266,13 +293,26 @@ def product_detail(request, product_id):
     
     context = {
         'product': product,
-        'history': history,
         'deal_score': deal_score,
         'percentage_diff': percentage_diff,
         'lowest_price': lowest_price,
     }
     return render(request, 'tracker/product_detail.html', context)
 
+def product_status(request, product_id):
+    """API endpoint reporting a product's background fetch state and current data."""
+    product = get_object_or_404(Product, id=product_id)
+    return JsonResponse({
+        'id': product.id,
+        'fetch_status': product.fetch_status,
+        'fetch_error': product.fetch_error,
+        'name': product.name,
+        'image_url': product.image_url,
+        'currency': product.currency,
+        'current_price': float(product.current_price) if product.current_price is not None else None,
+        'last_checked': product.last_checked.isoformat() if product.last_checked else None,
+    })
+
 def search_alternatives(request, product_id):
     """API endpoint to search for alternative prices."""
     try:
@@ -283,14 +323,67 @@ def search_alternatives(request, product_id):
         # Simple cleanup: take first 4-5 words to avoid over-specificity
         query = " ".join(query.split()[:5])
         
-        # Search all marketplaces (including source)
-        results = search_products(query)
-        return JsonResponse({'results': results})
+        # Search all marketplaces (including source); stores that miss the
+        # deadline are listed in 'missing' and the response marked partial
+        return JsonResponse(cached_search_marketplaces(query))
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Product not found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def api_import_products(request):
+    """
+    API endpoint for bulk imports. POST a JSON list of {"url", "target_price"}
+    items, or CSV (as the body or a 'file' upload). Products are created
+    pending and fetched by the refresh_prices worker; poll the returned
+    status_url for per-row progress.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    upload = request.FILES.get('file')
+    try:
+        if upload:
+            items = parse_import(upload.read(), upload.content_type or '')
+        else:
+            items = parse_import(request.body, request.content_type or '')
+    except ImportFormatError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not items:
+        return JsonResponse({'error': 'No items to import'}, status=400)
+
+    job = create_import(request.user, items)
+    data = import_status(job)
+    data['status_url'] = reverse('import_status', args=[job.id])
+    return JsonResponse(data, status=202)
+
+def import_job_status(request, job_id):
+    """API endpoint reporting per-row progress of a bulk import."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return JsonResponse(import_status(job, include_rows=request.GET.get('rows') != '0'))
+
+def metrics(request):
+    """
+    Request metrics in Prometheus text format, for staff or with
+    'Authorization: Bearer <METRICS_TOKEN>'.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not request.user.is_staff and not (token and constant_time_compare(authorization, f"Bearer {token}")):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def search_cache_stats(request):
+    """API endpoint exposing alternative-search cache hit/miss counters (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse(search_stats.as_dict())
+
 from django.contrib.auth import login
 from .forms import SignUpForm
 
@@ -330,27 +423,11 @@ from django.contrib.auth.decorators import login_required
 
 @login_required
 def profile(request):
-    products = Product.objects.filter(user=request.user)
-    total_products = products.count()
-    
-    # Calculate active deals (products below target price)
-    active_deals = sum(1 for p in products if p.is_below_threshold)
+    stats = get_deal_summary(request.user)
     
-    # Calculate potential savings
-    potential_savings = sum(
-        (p.target_price - p.current_price) 
-        for p in products 
-        if p.is_below_threshold and p.current_price and p.target_price
-    )
-    
-    context = {
-        'total_products': total_products,
-        'active_deals': active_deals,
-        'potential_savings': potential_savings,
-    }
     context = {
-        'total_products': total_products,
-        'active_deals': active_deals,
-        'potential_savings': potential_savings,
+        'total_products': stats['total'],
+        'active_deals': stats['deals'],
+        'potential_savings': stats['savings'],
     }
     return render(request, 'tracker/profile.html', context)